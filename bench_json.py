@@ -0,0 +1,132 @@
+# ~/Downloads/OnboardingKarol/bench_json.py
+# Benchmark da camada JSON (fastjson) com resultados grandes de query do Notion.
+#
+# Uso:
+#   python bench_json.py                 # 100, 1.000 e 10.000 páginas
+#   python bench_json.py --paginas 5000 --repeticoes 20
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+import fastjson
+
+
+def _pagina(i: int) -> Dict[str, Any]:
+    """Página completa como o Notion devolve (todas as propriedades, metadados)."""
+    texto = lambda s: [{  # noqa: E731
+        "type": "text",
+        "text": {"content": s, "link": None},
+        "annotations": {"bold": False, "italic": False, "strikethrough": False,
+                        "underline": False, "code": False, "color": "default"},
+        "plain_text": s,
+        "href": None,
+    }]
+    return {
+        "object": "page",
+        "id": f"1f0c2a3b-{i % 10000:04d}-4c5d-8e9f-0a1b2c3d4e5f",
+        "created_time": "2025-06-01T12:00:00.000Z",
+        "last_edited_time": "2025-06-02T12:00:00.000Z",
+        "created_by": {"object": "user", "id": "u-1"},
+        "last_edited_by": {"object": "user", "id": "u-1"},
+        "cover": None,
+        "icon": None,
+        "parent": {"type": "data_source_id", "data_source_id": "ds-1"},
+        "archived": False,
+        "in_trash": False,
+        "url": f"https://www.notion.so/pagina-{i}",
+        "public_url": None,
+        "properties": {
+            "Student Name": {"id": "title", "type": "title", "title": texto(f"Aluno Número {i}")},
+            "Email": {"id": "a1", "type": "email", "email": f"aluno{i}@exemplo.com.br"},
+            "Telefone": {"id": "a2", "type": "rich_text", "rich_text": texto("5511987654321")},
+            "CPF": {"id": "a3", "type": "rich_text", "rich_text": texto(f"{i:011d}")},
+            "Plano": {"id": "a4", "type": "select",
+                      "select": {"id": "s1", "name": "VIP", "color": "blue"}},
+            "Tempo de contrato": {"id": "a5", "type": "status",
+                                  "status": {"id": "st1", "name": "anual", "color": "green"}},
+            "Inicio do contrato": {"id": "a6", "type": "date",
+                                   "date": {"start": "2025-06-01", "end": None, "time_zone": None}},
+            "Fim do contrato": {"id": "a7", "type": "date",
+                                "date": {"start": "2026-06-01", "end": None, "time_zone": None}},
+            "Data de Início": {"id": "a8", "type": "date",
+                               "date": {"start": "2025-06-01", "end": None, "time_zone": None}},
+            "Duração em meses": {"id": "a9", "type": "number", "number": 12},
+            "Dia da Semana das aulas": {"id": "b1", "type": "select",
+                                        "select": {"id": "s2", "name": "Terça", "color": "red"}},
+            "Endereço Completo": {"id": "b2", "type": "rich_text",
+                                  "rich_text": texto("Rua das Flores, 123 — São Paulo/SP")},
+            "Pausas Consideradas": {"id": "b3", "type": "rich_text",
+                                    "rich_text": texto("14/07/2025 a 31/07/2025 (Férias Meio do Ano)")},
+        },
+    }
+
+
+def _resposta_query(n: int) -> Dict[str, Any]:
+    return {
+        "object": "list",
+        "results": [_pagina(i) for i in range(n)],
+        "next_cursor": None,
+        "has_more": False,
+        "type": "page_or_data_source",
+    }
+
+
+def _medir(fn: Callable[[], Any], repeticoes: int) -> float:
+    tempos: List[float] = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return statistics.median(tempos) * 1000
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def rodar(paginas: int, repeticoes: int) -> None:
+    resposta = _resposta_query(paginas)
+    corpo = _stdlib_dumps(resposta)
+    # Mesma query com filter_properties (só as 3 propriedades do cálculo de contrato)
+    projetadas = ("Data de Início", "Duração em meses", "Dia da Semana das aulas")
+    resposta_proj = {**resposta, "results": [
+        {**p, "properties": {k: v for k, v in p["properties"].items() if k in projetadas}}
+        for p in resposta["results"]
+    ]}
+    corpo_proj = _stdlib_dumps(resposta_proj)
+    # Corpo típico de PATCH montado por _build_props/_montar_props_notion
+    body_props = {"properties": {
+        k: v for k, v in _pagina(0)["properties"].items() if k not in ("Email",)
+    }}
+
+    casos = [
+        ("decode query (stdlib json)", lambda: json.loads(corpo)),
+        (f"decode query (fastjson/{fastjson.BACKEND})", lambda: fastjson.loads(corpo)),
+        (f"decode query projetada ({fastjson.BACKEND})", lambda: fastjson.loads(corpo_proj)),
+        ("encode query (stdlib json)", lambda: _stdlib_dumps(resposta)),
+        (f"encode query (fastjson/{fastjson.BACKEND})", lambda: fastjson.dumps(resposta)),
+        ("encode PATCH props ×1000 (stdlib)", lambda: [_stdlib_dumps(body_props) for _ in range(1000)]),
+        (f"encode PATCH props ×1000 ({fastjson.BACKEND})",
+         lambda: [fastjson.dumps(body_props) for _ in range(1000)]),
+    ]
+    print(f"\n📦 {paginas} páginas — {len(corpo) / 1024:.0f} KiB "
+          f"({len(corpo_proj) / 1024:.0f} KiB com filter_properties)")
+    for nome, fn in casos:
+        print(f"   {nome:<42} {_medir(fn, repeticoes):9.2f} ms (mediana de {repeticoes})")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark JSON: stdlib vs fastjson em payloads do Notion")
+    p.add_argument("--paginas", type=int, nargs="*", default=[100, 1000, 10000])
+    p.add_argument("--repeticoes", type=int, default=10)
+    args = p.parse_args()
+    print(f"Backend ativo: {fastjson.BACKEND}")
+    for n in args.paginas:
+        rodar(n, args.repeticoes)
+
+
+if __name__ == "__main__":
+    main()
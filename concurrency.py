@@ -0,0 +1,353 @@
+# ~/Downloads/OnboardingKarol/concurrency.py
+# Primitivas de concorrência do serviço (asyncio, um processo).
+
+import asyncio
+import contextvars
+import hashlib
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastjson import dumps
+from logs import campos as campos_log, get_logger
+from tracing import span
+
+log = get_logger("concurrency")
+
+
+class KeyedSerializer:
+    """
+    Serializa trabalhos pela chave (ex.: e-mail do aluno) e mescla duplicatas.
+
+    - Trabalhos com a mesma chave rodam um de cada vez, na ordem de chegada.
+    - Um trabalho idêntico (mesma chave + mesma impressão digital) que chega
+      enquanto outro igual está na fila ou rodando não roda de novo: recebe o
+      mesmo resultado (ou a mesma exceção).
+    - Chaves diferentes não se bloqueiam; os locks somem quando ficam ociosos.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        self._em_voo: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    def _adquirir_ref(self, chave: str) -> asyncio.Lock:
+        lock, refs = self._locks.get(chave, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[chave] = (lock, refs + 1)
+        return lock
+
+    def _soltar_ref(self, chave: str) -> None:
+        lock, refs = self._locks[chave]
+        if refs <= 1:
+            del self._locks[chave]
+        else:
+            self._locks[chave] = (lock, refs - 1)
+
+    async def run(self, chave: str, impressao: str, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        existente = self._em_voo.get((chave, impressao))
+        if existente is not None:
+            with span("fila.coalescido"):
+                return await asyncio.shield(existente)
+
+        futuro: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._em_voo[(chave, impressao)] = futuro
+        lock = self._adquirir_ref(chave)
+        try:
+            with span("fila.aluno", aguardando=lock.locked()):
+                await lock.acquire()
+            try:
+                resultado = await fabrica()
+            finally:
+                lock.release()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                futuro.cancel()
+            elif not futuro.done():
+                futuro.set_exception(e)
+                futuro.exception()  # marca como consumida se ninguém mais esperava
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            self._em_voo.pop((chave, impressao), None)
+            self._soltar_ref(chave)
+
+    def stats(self) -> Dict[str, int]:
+        return {"chaves_ativas": len(self._locks), "em_voo": len(self._em_voo)}
+
+
+class AdmissaoRecusada(Exception):
+    """Sem vaga na rota: o cliente deve tentar de novo depois de `retry_after` segundos."""
+
+    def __init__(self, rota: str, status: int, motivo: str, retry_after: int):
+        super().__init__(f"{rota}: {motivo}")
+        self.rota = rota
+        self.status = status
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+class Admissao:
+    """
+    Limite de concorrência de uma rota com uma fila de espera curta.
+
+    - Até `limite` requisições rodam ao mesmo tempo.
+    - Até `fila` outras esperam no máximo `espera_s` por uma vaga.
+    - Fila cheia → 429 na hora; espera estourada → 503. Ambos com Retry-After,
+      para o ZapSign/automações tentarem de novo em vez de empilhar chamadas.
+    """
+
+    def __init__(self, rota: str, limite: int, fila: int, espera_s: float, retry_after: int):
+        self.rota = rota
+        self.limite = max(1, limite)
+        self.fila = max(0, fila)
+        self.espera_s = espera_s
+        self.retry_after = retry_after
+        self._vagas = asyncio.Semaphore(self.limite)
+        self.em_voo = 0
+        self.na_fila = 0
+        self.aceitas = 0
+        self.recusadas_fila_cheia = 0
+        self.recusadas_espera = 0
+
+    @classmethod
+    def do_ambiente(cls, rota: str, limite: int, fila: int, espera_s: float = 2.0,
+                    retry_after: int = 5) -> "Admissao":
+        """Lê ADMISSAO_<ROTA>_LIMITE / _FILA / _ESPERA_S / _RETRY_AFTER (padrões no argumento)."""
+        prefixo = f"ADMISSAO_{rota.upper()}_"
+        return cls(
+            rota,
+            limite=int(os.getenv(prefixo + "LIMITE", limite)),
+            fila=int(os.getenv(prefixo + "FILA", fila)),
+            espera_s=float(os.getenv(prefixo + "ESPERA_S", espera_s)),
+            retry_after=int(os.getenv(prefixo + "RETRY_AFTER", retry_after)),
+        )
+
+    @asynccontextmanager
+    async def vaga(self) -> AsyncIterator[None]:
+        if self._vagas.locked():
+            if self.na_fila >= self.fila:
+                self.recusadas_fila_cheia += 1
+                raise AdmissaoRecusada(self.rota, 429, "fila cheia", self.retry_after)
+            self.na_fila += 1
+            try:
+                await asyncio.wait_for(self._vagas.acquire(), timeout=self.espera_s)
+            except asyncio.TimeoutError:
+                self.recusadas_espera += 1
+                raise AdmissaoRecusada(self.rota, 503, "tempo de espera esgotado", self.retry_after)
+            finally:
+                self.na_fila -= 1
+        else:
+            await self._vagas.acquire()
+
+        self.em_voo += 1
+        self.aceitas += 1
+        try:
+            yield
+        finally:
+            self.em_voo -= 1
+            self._vagas.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limite": self.limite,
+            "fila_max": self.fila,
+            "em_voo": self.em_voo,
+            "na_fila": self.na_fila,
+            "aceitas": self.aceitas,
+            "recusadas_fila_cheia": self.recusadas_fila_cheia,
+            "recusadas_espera": self.recusadas_espera,
+        }
+
+
+class FalhaGravacao(Exception):
+    """
+    Erro devolvido pelo `gravar` do WriteBehind. Com `retentavel` (429, 5xx, rede)
+    os campos voltam ao buffer e a gravação é tentada de novo depois de
+    `retry_after` segundos (ou do backoff exponencial, se o vendor não disse).
+    """
+
+    def __init__(self, mensagem: str, retentavel: bool, retry_after: Optional[float] = None):
+        super().__init__(mensagem)
+        self.retentavel = retentavel
+        self.retry_after = retry_after
+
+
+class WriteBehind:
+    """
+    Buffer de escrita por chave (ex.: page_id do Notion) que mescla atualizações.
+
+    `agendar(chave, campos)` junta os campos aos já pendentes para a chave (o valor
+    mais recente de cada campo vence). A primeira escrita abre uma janela de
+    `janela_s`; quando ela fecha, `gravar(chave, campos)` é chamado uma vez com tudo
+    que chegou no meio. Gravações da mesma chave nunca se sobrepõem.
+    `flush()` grava na hora e `fechar()` esvazia o buffer (shutdown).
+    Com janela 0 o buffer fica desligado e `ativo` é False.
+
+    No máximo `max_concorrencia` gravações rodam ao mesmo tempo (todas as chaves),
+    para que muitas janelas vencendo juntas não virem uma rajada contra o vendor.
+
+    Uma FalhaGravacao retentável devolve os campos ao buffer (por baixo dos que
+    chegaram depois) com backoff; após `max_tentativas` a atualização é descartada
+    e conta em `falhas`. Campos que um flush posterior já levou não voltam: cada
+    flush da chave recebe um número e só o último que levou o campo pode devolvê-lo.
+    """
+
+    BACKOFF_INICIAL_S = 1.0
+    BACKOFF_MAXIMO_S = 60.0
+
+    def __init__(self, janela_s: float, gravar: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                 max_tentativas: int = 5, max_concorrencia: int = 2):
+        self.janela_s = max(0.0, janela_s)
+        self._vagas = asyncio.Semaphore(max(1, max_concorrencia))
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.gravando = 0
+        self._gravar = gravar
+        self.max_tentativas = max(1, max_tentativas)
+        self._tentativas: Dict[str, int] = {}
+        # chave → número do último flush; chave → {campo: número do último flush que o levou}
+        self._seq: Dict[str, int] = {}
+        self._levado_por: Dict[str, Dict[str, int]] = {}
+        self._fechando = False
+        self._pendentes: Dict[str, Dict[str, Any]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._tarefas: set = set()
+        self._serial = KeyedSerializer()
+        self.agendadas = 0
+        self.mescladas = 0
+        self.gravacoes = 0
+        self.reagendadas = 0
+        self.falhas = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.janela_s > 0
+
+    def agendar(self, chave: str, campos: Dict[str, Any]) -> None:
+        self.agendadas += 1
+        pendente = self._pendentes.get(chave)
+        if pendente is None:
+            self._pendentes[chave] = dict(campos)
+        else:
+            self.mescladas += 1
+            pendente.update(campos)
+        if chave not in self._timers:
+            self._agendar_timer(chave, self.janela_s)
+
+    def _agendar_timer(self, chave: str, atraso: float) -> None:
+        # Contexto vazio: a gravação sai do trace do request que abriu a janela
+        tarefa = asyncio.create_task(self._expirar(chave, atraso), context=contextvars.Context())
+        self._timers[chave] = tarefa
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _expirar(self, chave: str, atraso: float) -> None:
+        await asyncio.sleep(atraso)
+        # Sem await entre o fim da espera e o pop: flush() só cancela timers ainda dormindo
+        self._timers.pop(chave, None)
+        await self._flush_chave(chave)
+
+    async def _flush_chave(self, chave: str) -> Any:
+        campos = self._pendentes.pop(chave, None)
+        if campos is None:
+            return None
+        self.gravacoes += 1
+        n = self._seq[chave] = self._seq.get(chave, 0) + 1
+        levado_por = self._levado_por.setdefault(chave, {})
+        for campo in campos:
+            levado_por[campo] = n
+        try:
+            resultado = await self._serial.run(chave, digital(dumps(campos)), lambda: self._gravar_com_vaga(chave, campos))
+        except Exception as e:
+            self._falhou(chave, n, campos, e)
+            return e
+        self._tentativas.pop(chave, None)
+        self._esquecer(chave, n)
+        return resultado
+
+    def _esquecer(self, chave: str, n: int) -> None:
+        # Só o último flush da chave limpa; um posterior ainda na fila precisa do registro
+        if self._seq.get(chave) == n:
+            self._seq.pop(chave, None)
+            self._levado_por.pop(chave, None)
+
+    async def _gravar_com_vaga(self, chave: str, campos: Dict[str, Any]) -> Any:
+        async with self._vagas:
+            self.gravando += 1
+            try:
+                return await self._gravar(chave, campos)
+            finally:
+                self.gravando -= 1
+
+    def _falhou(self, chave: str, n: int, campos: Dict[str, Any], erro: Exception) -> None:
+        tentativa = self._tentativas.get(chave, 0) + 1
+        # Um flush posterior já levou (e vai gravar) o valor mais novo desses campos
+        levado_por = self._levado_por.get(chave, {})
+        campos = {c: v for c, v in campos.items() if levado_por.get(c) == n}
+        if not campos:
+            self._esquecer(chave, n)
+            return
+        if not getattr(erro, "retentavel", False) or tentativa >= self.max_tentativas or self._fechando:
+            self._tentativas.pop(chave, None)
+            self._esquecer(chave, n)
+            self.falhas += 1
+            log.error(
+                "Falha ao gravar %s (write-behind, tentativa %s) — atualização descartada: %s",
+                chave, tentativa, erro, extra=campos_log(campos=sorted(campos)),
+            )
+            return
+        self._tentativas[chave] = tentativa
+        self.reagendadas += 1
+        # O que chegou depois da falha é mais novo e vence campo a campo
+        self._pendentes[chave] = {**campos, **self._pendentes.get(chave, {})}
+        atraso = getattr(erro, "retry_after", None) or min(
+            self.BACKOFF_INICIAL_S * 2 ** (tentativa - 1), self.BACKOFF_MAXIMO_S
+        )
+        timer = self._timers.pop(chave, None)
+        if timer:
+            timer.cancel()
+        self._agendar_timer(chave, atraso)
+        log.warning("⏳ Gravação de %s adiada %.1fs (tentativa %s): %s", chave, atraso, tentativa, erro)
+
+    async def flush(self, chave: Optional[str] = None) -> Dict[str, Any]:
+        """Grava já (uma chave ou todas) e devolve {chave: retorno de gravar ou exceção}."""
+        chaves = [chave] if chave is not None else list(self._pendentes)
+        for c in chaves:
+            timer = self._timers.pop(c, None)
+            if timer:
+                timer.cancel()
+        resultados = await asyncio.gather(*(self._flush_chave(c) for c in chaves))
+        return {c: r for c, r in zip(chaves, resultados) if c is not None}
+
+    async def fechar(self) -> Dict[str, Any]:
+        """
+        Esvazia o buffer; as gravações já em andamento (timers vencidos) terminam antes.
+        No shutdown não há nova tentativa: o que falhar é logado e descartado.
+        """
+        self._fechando = True
+        resultados = await self.flush()
+        if self._tarefas:
+            await asyncio.gather(*self._tarefas, return_exceptions=True)
+        return resultados
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "janela_ms": round(self.janela_s * 1000),
+            "pendentes": len(self._pendentes),
+            "gravando": self.gravando,
+            "max_concorrencia": self.max_concorrencia,
+            "agendadas": self.agendadas,
+            "mescladas": self.mescladas,
+            "gravacoes": self.gravacoes,
+            "reagendadas": self.reagendadas,
+            "falhas": self.falhas,
+        }
+
+
+def digital(conteudo: str | bytes) -> str:
+    """Impressão digital curta de um payload (para detectar reenvios idênticos)."""
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    return hashlib.blake2b(conteudo, digest_size=12).hexdigest()
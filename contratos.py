@@ -0,0 +1,196 @@
+# ~/Downloads/OnboardingKarol/contratos.py
+# Cálculo da data de fim de contrato (pausas/férias e feriados).
+#
+# Módulo puro: sem Settings, HTTP nem FastAPI. Usado pelas rotas /calculo/* do
+# main.py (inclusive a cotação /calculo/simular) e pelo recálculo em lote
+# (recalcular_contratos.py), que roda em processos separados.
+
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from logs import get_logger
+
+log = get_logger("contratos")
+
+# JSON opcional {"pausas": [[ini, fim, desc], ...], "feriados": [[data, desc], ...]}
+# que substitui o calendário abaixo; recarregado quando o arquivo muda.
+CALENDARIO_FILE = os.getenv("CALENDARIO_FILE")
+
+# Pausas (férias) e feriados
+pausas = [
+    ("2025-07-14", "2025-07-31", "Férias Meio do Ano"),
+    ("2025-12-17", "2026-01-09", "Férias Fim de Ano"),
+    ("2026-02-16", "2026-02-20", "Carnaval 2026"),
+    ("2026-07-15", "2026-07-31", "Férias Meio do Ano"),
+    ("2026-12-16", "2027-01-08", "Férias Fim de Ano"),
+    ("2027-07-15", "2027-07-31", "Férias Meio do Ano"),
+    ("2027-12-15", "2028-01-07", "Férias Fim de Ano"),
+    ("2027-02-08", "2027-02-12", "Carnaval 2027"),
+]
+
+feriados = [
+    ("2025-04-21", "Feriado Tiradentes"),
+    ("2025-05-01", "Feriado Dia do Trabalho"),
+    ("2025-06-19", "Feriado Corpus Christi"),
+    ("2025-11-20", "Feriado Consciência Negra"),
+    ("2026-04-21", "Feriado Tiradentes"),
+    ("2026-05-01", "Feriado Dia do Trabalho"),
+    ("2026-06-19", "Feriado Corpus Christi"),
+    ("2026-09-07", "Feriado Dia da Independência"),
+    ("2026-10-12", "Feriado Nossa Senhora Aparecida"),
+    ("2026-11-02", "Feriado Dia de Finados"),
+    ("2026-11-20", "Feriado Consciência Negra"),
+    ("2027-04-21", "Feriado Tiradentes"),
+    ("2027-09-07", "Feriado Dia da Independência"),
+    ("2027-10-12", "Feriado Nossa Senhora Aparecida"),
+    ("2027-11-02", "Feriado Dia de Finados"),
+    ("2027-11-15", "Feriado Proclamação da República"),
+]
+
+dias_semana = {"Segunda": 0, "Terça": 1, "Quarta": 2, "Quinta": 3, "Sexta": 4}
+
+ResultadoContrato = Tuple[str, int, List[str], List[str]]
+
+
+class Calendario:
+    """Pausas e feriados já convertidos para datetime, com as legendas prontas."""
+
+    def __init__(self, pausas: Sequence[Tuple[str, str, str]], feriados: Sequence[Tuple[str, str]]):
+        self.pausas = []
+        for ini_str, fim_str, desc in pausas:
+            ini_dt = datetime.strptime(ini_str, "%Y-%m-%d")
+            fim_dt = datetime.strptime(fim_str, "%Y-%m-%d")
+            legenda = f"{ini_dt.strftime('%d/%m/%Y')} a {fim_dt.strftime('%d/%m/%Y')} ({desc})"
+            self.pausas.append((ini_dt, fim_dt, legenda))
+        self.feriados = []
+        for feriado_str, feriado_desc in feriados:
+            feriado_dt = datetime.strptime(feriado_str, "%Y-%m-%d")
+            legenda = f"{feriado_dt.strftime('%d/%m/%Y')} ({feriado_desc})"
+            self.feriados.append((feriado_dt, feriado_dt.weekday(), legenda))
+        conteudo = repr((sorted(pausas), sorted(feriados))).encode("utf-8")
+        self.digital = hashlib.blake2b(conteudo, digest_size=8).hexdigest()
+
+
+CALENDARIO = Calendario(pausas, feriados)
+
+_arquivo: Dict[str, object] = {"mtime": None, "calendario": None, "checado": 0.0}
+
+
+def calendario_atual(intervalo_s: float = 5.0) -> Calendario:
+    """
+    CALENDARIO, ou o de CALENDARIO_FILE (o mtime é checado no máximo a cada `intervalo_s`).
+    Arquivo ausente ou inválido não derruba ninguém: fica o último calendário bom
+    (ou o embutido) e o problema é logado uma vez por mudança no arquivo.
+    """
+    if not CALENDARIO_FILE:
+        return CALENDARIO
+    agora = time.monotonic()
+    if _arquivo["calendario"] is not None and agora - _arquivo["checado"] < intervalo_s:
+        return _arquivo["calendario"]
+    _arquivo["checado"] = agora
+    mtime = None
+    try:
+        mtime = os.path.getmtime(CALENDARIO_FILE)
+        if mtime != _arquivo["mtime"]:
+            with open(CALENDARIO_FILE, encoding="utf-8") as f:
+                dados = json.load(f)
+            _arquivo["calendario"] = Calendario(
+                [tuple(p) for p in dados.get("pausas", [])],
+                [tuple(f) for f in dados.get("feriados", [])],
+            )
+            _arquivo["mtime"] = mtime
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        if mtime != _arquivo["mtime"] or _arquivo["calendario"] is None:
+            usado = "o calendário embutido" if _arquivo["calendario"] in (None, CALENDARIO) else "o último calendário válido"
+            log.warning("⚠️ CALENDARIO_FILE inválido (%s) — usando %s", e, usado)
+        _arquivo["mtime"] = mtime
+        if _arquivo["calendario"] is None:
+            _arquivo["calendario"] = CALENDARIO
+    return _arquivo["calendario"]
+
+
+def calcular_fim_contrato(
+    data_inicio_str: str, duracao_meses: int, dia_aula_str: str, calendario: Optional[Calendario] = None
+) -> ResultadoContrato:
+    calendario = calendario or calendario_atual()
+    data_inicio = datetime.strptime(data_inicio_str, "%Y-%m-%d")
+    data_fim_base = data_inicio + timedelta(days=30 * duracao_meses)
+    dias_a_mais = 7
+
+    pausas_consideradas: List[str] = []
+    feriados_considerados: List[str] = []
+
+    dia_aula_num = dias_semana.get(dia_aula_str, -1)
+
+    for ini_dt, fim_dt, legenda in calendario.pausas:
+        overlap_ini = max(data_inicio, ini_dt)
+        overlap_fim = min(data_fim_base, fim_dt)
+        if overlap_ini <= overlap_fim:
+            delta = (overlap_fim - overlap_ini).days + 1
+            dias_a_mais += delta
+            pausas_consideradas.append(legenda)
+
+    for feriado_dt, dia_semana, legenda in calendario.feriados:
+        if data_inicio <= feriado_dt <= data_fim_base and dia_semana == dia_aula_num:
+            dias_a_mais += 1
+            feriados_considerados.append(legenda)
+
+    data_fim = data_fim_base + timedelta(days=dias_a_mais)
+    pausas_consideradas.sort()
+    feriados_considerados.sort()
+    return data_fim.strftime("%Y-%m-%d"), dias_a_mais, pausas_consideradas, feriados_considerados
+
+
+# ─────────────────────────── TABELA DE COTAÇÕES ─────────────────────
+class TabelaCotacoes:
+    """
+    Resultados pré-calculados para cada data de início da janela × duração × dia da aula.
+
+    A busca é um acesso a dict. Fora da janela (ou duração/dia fora da tabela),
+    `buscar` devolve None e quem chama calcula na hora. `valida` diz se a tabela
+    ainda corresponde ao calendário e ao dia de hoje.
+    """
+
+    def __init__(self, calendario: Calendario, hoje: date, dias_antes: int, dias_depois: int,
+                 duracoes: Iterable[int]):
+        self.calendario_digital = calendario.digital
+        self.hoje = hoje
+        self.inicio = hoje - timedelta(days=dias_antes)
+        self.fim = hoje + timedelta(days=dias_depois)
+        self.duracoes = sorted(set(duracoes))
+        self._resultados: Dict[Tuple[int, int, int], ResultadoContrato] = {}
+
+        inicio = time.perf_counter()
+        # As listas de legendas se repetem muito; guardar uma cópia de cada economiza memória
+        legendas: Dict[Tuple[str, ...], List[str]] = {}
+        d = self.inicio
+        while d <= self.fim:
+            data_str = d.isoformat()
+            for duracao in self.duracoes:
+                for dia_aula, dia_num in dias_semana.items():
+                    data_fim, dias_a_mais, p, f = calcular_fim_contrato(data_str, duracao, dia_aula, calendario)
+                    p = legendas.setdefault(tuple(p), p)
+                    f = legendas.setdefault(tuple(f), f)
+                    self._resultados[(d.toordinal(), duracao, dia_num)] = (data_fim, dias_a_mais, p, f)
+            d += timedelta(days=1)
+        self.segundos = time.perf_counter() - inicio
+
+    def valida(self, calendario: Calendario, hoje: date) -> bool:
+        return calendario.digital == self.calendario_digital and hoje == self.hoje
+
+    def buscar(self, data_inicio: date, duracao_meses: int, dia_aula_str: str) -> Optional[ResultadoContrato]:
+        return self._resultados.get((data_inicio.toordinal(), duracao_meses, dias_semana.get(dia_aula_str, -1)))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "entradas": len(self._resultados),
+            "inicio": self.inicio.isoformat(),
+            "fim": self.fim.isoformat(),
+            "duracoes": self.duracoes,
+            "calendario": self.calendario_digital,
+            "construida_em_s": round(self.segundos, 3),
+        }
@@ -0,0 +1,39 @@
+# ~/Downloads/OnboardingKarol/fastjson.py
+# Camada de (de)serialização JSON usada com os vendors e nas respostas da API.
+# Usa orjson quando instalado; senão cai para o json da stdlib.
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def dumps(obj: Any) -> bytes:
+    """Serializa para bytes UTF-8 (corpo pronto para `content=` do httpx/requests)."""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    """Decodifica o corpo de uma resposta (`r.content`)."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ORJSONResponse(JSONResponse):
+    """Resposta padrão da API serializada com orjson (ou json, se indisponível)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+DefaultResponse = ORJSONResponse if orjson else JSONResponse
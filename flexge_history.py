@@ -0,0 +1,240 @@
+# ~/Downloads/OnboardingKarol/flexge_history.py
+# Histórico local do tempo de estudo semanal no Flexge.
+#
+# Cada coleta semanal vira linhas (aluno, semana, segundos) guardadas em colunas
+# array-backed e persistidas num arquivo binário compacto. Rankings por período,
+# tendência por aluno e sequências de semanas são respondidos sem chamar o Flexge.
+# O aluno é identificado pelo id do Flexge; o nome é só o rótulo (o mais recente).
+#
+# Formato do arquivo (little-endian):
+#   b"FXH2" | n_alunos:u32 | n_linhas:u32
+#   n_alunos × (len:u16, id utf-8, len:u16, nome utf-8)
+#   coluna aluno:u32[n_linhas] | coluna semana:i32[n_linhas] | coluna segundos:u32[n_linhas]
+# Arquivos b"FXH1" (antigos, só com o nome) são lidos usando o nome como id.
+
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logs import get_logger
+
+FLEXGE_HISTORY_FILE = os.getenv("FLEXGE_HISTORY_FILE", "/tmp/flexge_history.bin")
+
+_MAGIC = b"FXH2"
+_MAGIC_V1 = b"FXH1"
+_HEADER = struct.Struct("<4sII")
+_NOME_LEN = struct.Struct("<H")
+
+
+# ─────────────────────────── SEMANAS ISO ────────────────────────────
+# Internamente a semana é um inteiro sequencial (segundas-feiras desde 0001-01-01),
+# o que torna "semanas consecutivas" uma simples diferença de 1.
+def semana_de_data(d: date | datetime) -> int:
+    if isinstance(d, datetime):
+        d = d.date()
+    return (d.toordinal() - 1) // 7
+
+
+def semana_iso(semana: int) -> str:
+    ano, num, _ = date.fromordinal(semana * 7 + 1).isocalendar()
+    return f"{ano}-W{num:02d}"
+
+
+def parse_semana(txt: str) -> int:
+    """Aceita '2025-W07', '2025W07' ou uma data 'YYYY-MM-DD' (semana que a contém)."""
+    txt = (txt or "").strip().upper()
+    m = re.fullmatch(r"(\d{4})-?W(\d{1,2})", txt)
+    if m:
+        return semana_de_data(date.fromisocalendar(int(m.group(1)), int(m.group(2)), 1))
+    return semana_de_data(datetime.strptime(txt, "%Y-%m-%d"))
+
+
+# ─────────────────────────── ARMAZENAMENTO ──────────────────────────
+class HistoricoFlexge:
+    def __init__(self, caminho: str = FLEXGE_HISTORY_FILE):
+        self.caminho = caminho
+        self.ids: List[str] = []
+        self.nomes: List[str] = []
+        self._idx_id: Dict[str, int] = {}
+        self.aluno = array("I")
+        self.semana = array("i")
+        self.segundos = array("I")
+        self._linha: Dict[Tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+
+    # ── persistência ────────────────────────────────────────────────
+    @classmethod
+    def carregar(cls, caminho: str = FLEXGE_HISTORY_FILE) -> "HistoricoFlexge":
+        h = cls(caminho)
+        if not os.path.exists(caminho):
+            return h
+        with open(caminho, "rb") as f:
+            magic, n_alunos, n_linhas = _HEADER.unpack(f.read(_HEADER.size))
+            if magic not in (_MAGIC, _MAGIC_V1):
+                raise ValueError(f"{caminho}: arquivo de histórico inválido")
+            for _ in range(n_alunos):
+                id_ = h._ler_texto(f)
+                nome = h._ler_texto(f) if magic == _MAGIC else id_
+                h._novo_aluno(id_, nome)
+            for coluna in (h.aluno, h.semana, h.segundos):
+                coluna.fromfile(f, n_linhas)
+                if sys.byteorder != "little":
+                    coluna.byteswap()
+        h._linha = {(a, s): i for i, (a, s) in enumerate(zip(h.aluno, h.semana))}
+        return h
+
+    def salvar(self) -> None:
+        with self._lock:
+            tmp = f"{self.caminho}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, len(self.nomes), len(self.aluno)))
+                for id_, nome in zip(self.ids, self.nomes):
+                    for texto in (id_, nome):
+                        dados = texto.encode("utf-8")
+                        f.write(_NOME_LEN.pack(len(dados)) + dados)
+                for coluna in (self.aluno, self.semana, self.segundos):
+                    if sys.byteorder != "little":
+                        coluna = array(coluna.typecode, coluna)
+                        coluna.byteswap()
+                    coluna.tofile(f)
+            os.replace(tmp, self.caminho)
+
+    @staticmethod
+    def _ler_texto(f) -> str:
+        (tam,) = _NOME_LEN.unpack(f.read(_NOME_LEN.size))
+        return f.read(tam).decode("utf-8")
+
+    # ── escrita ─────────────────────────────────────────────────────
+    def _novo_aluno(self, id_: str, nome: str) -> int:
+        idx = self._idx_id.get(id_)
+        if idx is None and id_ != nome:
+            # Linha de um arquivo FXH1 (id = nome): o primeiro id que chega com esse nome a assume
+            legado = self._idx_id.get(nome)
+            if legado is not None and self.ids[legado] == self.nomes[legado]:
+                del self._idx_id[nome]
+                self.ids[legado] = id_
+                self._idx_id[id_] = idx = legado
+        if idx is None:
+            idx = len(self.ids)
+            self.ids.append(id_)
+            self.nomes.append(nome)
+            self._idx_id[id_] = idx
+        elif nome:
+            self.nomes[idx] = nome  # aluno renomeado: o histórico continua no mesmo id
+        return idx
+
+    def registrar_semana(self, semana: int, registros: Iterable[Tuple[str, str, int]]) -> int:
+        """Grava (id, nome, segundos) da semana; recoletar a mesma semana sobrescreve."""
+        n = 0
+        with self._lock:
+            for id_, nome, segundos in registros:
+                id_ = id_ or nome
+                if not id_:
+                    continue
+                idx = self._novo_aluno(id_, nome or id_)
+                segundos = max(0, int(segundos or 0))
+                linha = self._linha.get((idx, semana))
+                if linha is None:
+                    self._linha[(idx, semana)] = len(self.aluno)
+                    self.aluno.append(idx)
+                    self.semana.append(semana)
+                    self.segundos.append(segundos)
+                else:
+                    self.segundos[linha] = segundos
+                n += 1
+        return n
+
+    # ── consultas ───────────────────────────────────────────────────
+    def resumo(self) -> Dict[str, object]:
+        semanas = sorted(set(self.semana))
+        return {
+            "alunos": len(self.ids),
+            "linhas": len(self.aluno),
+            "semanas": len(semanas),
+            "primeira_semana": semana_iso(semanas[0]) if semanas else None,
+            "ultima_semana": semana_iso(semanas[-1]) if semanas else None,
+            "bytes_colunas": len(self.aluno) * 12,
+        }
+
+    def ranking(self, inicio: int, fim: int, limite: int = 20, minimo: int = 0) -> List[Tuple[str, str, int, int]]:
+        """(id, nome, segundos no período, semanas com estudo), do maior para o menor."""
+        total: Dict[int, int] = {}
+        semanas: Dict[int, int] = {}
+        for a, s, seg in zip(self.aluno, self.semana, self.segundos):
+            if inicio <= s <= fim and seg:
+                total[a] = total.get(a, 0) + seg
+                semanas[a] = semanas.get(a, 0) + 1
+        ordenado = sorted(
+            ((self.ids[a], self.nomes[a], seg, semanas[a]) for a, seg in total.items() if seg >= minimo),
+            key=lambda x: x[2],
+            reverse=True,
+        )
+        return ordenado[:limite] if limite else ordenado
+
+    def ids_por_nome(self, nome: str) -> List[str]:
+        """Ids com esse nome (homônimos são alunos diferentes)."""
+        alvo = nome.strip().casefold()
+        return [id_ for id_, n in zip(self.ids, self.nomes) if n.casefold() == alvo]
+
+    def nome_de(self, id_: str) -> Optional[str]:
+        idx = self._idx_id.get(id_)
+        return None if idx is None else self.nomes[idx]
+
+    def tendencia(self, id_: str) -> List[Tuple[int, int]]:
+        """(semana, segundos) do aluno em ordem cronológica."""
+        idx = self._idx_id.get(id_)
+        if idx is None:
+            return []
+        return sorted((s, seg) for a, s, seg in zip(self.aluno, self.semana, self.segundos) if a == idx)
+
+    def sequencias(self, semanas_minimas: int, minimo: int = 3600, atual: bool = False,
+                   ate: Optional[int] = None) -> List[Tuple[str, str, int, int]]:
+        """
+        Alunos com pelo menos `semanas_minimas` semanas consecutivas >= `minimo`.
+        Devolve (id, nome, maior sequência, semana final da sequência). Com `atual`,
+        só conta a sequência que termina na semana `ate` (padrão: a última do histórico).
+        """
+        if ate is None:
+            ate = max(self.semana) if len(self.semana) else 0
+        por_aluno: Dict[int, List[int]] = {}
+        for a, s, seg in zip(self.aluno, self.semana, self.segundos):
+            if seg >= minimo and s <= ate:
+                por_aluno.setdefault(a, []).append(s)
+
+        saida = []
+        for a, semanas in por_aluno.items():
+            semanas.sort()
+            melhor, melhor_fim, corrente = 0, semanas[0], 0
+            anterior = None
+            for s in semanas:
+                corrente = corrente + 1 if anterior is not None and s == anterior + 1 else 1
+                anterior = s
+                if corrente >= melhor:
+                    melhor, melhor_fim = corrente, s
+            if atual:
+                melhor, melhor_fim = (corrente, anterior) if anterior == ate else (0, ate)
+            if melhor >= semanas_minimas:
+                saida.append((self.ids[a], self.nomes[a], melhor, melhor_fim))
+        saida.sort(key=lambda x: (-x[2], x[1], x[0]))
+        return saida
+
+
+_HISTORICO: Optional[HistoricoFlexge] = None
+
+
+def get_historico() -> HistoricoFlexge:
+    global _HISTORICO
+    if _HISTORICO is None:
+        try:
+            _HISTORICO = HistoricoFlexge.carregar()
+        except (OSError, ValueError, EOFError, struct.error) as e:
+            get_logger("flexge_history").warning(
+                "⚠️ Histórico Flexge ilegível (%s) — começando vazio", e
+            )
+            _HISTORICO = HistoricoFlexge()
+    return _HISTORICO
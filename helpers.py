@@ -1,15 +1,23 @@
 # ~/Downloads/OnboardingKarol/helpers.py
 # Versão 2025-06-06 f — inclui iso_or_brazil() para corrigir nextDueDate/endDate
 
+import asyncio
 import re
 import time
 import unicodedata
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
 
 import httpx
 from pydantic_settings import BaseSettings
 
+from fastjson import dumps, loads
+from logs import get_logger, campos, payload_vendor
+from tracing import span
+
 # ───────────────────────────── SETTINGS ─────────────────────────────
 class Settings(BaseSettings):
     NOTION_TOKEN: str
@@ -21,12 +29,17 @@ class Settings(BaseSettings):
     ZAPI_SECURITY_TOKEN: str | None = ""
     ASAAS_API_KEY: str
     ASAAS_BASE: str = "https://api.asaas.com/v3"
+    NOTION_BASE: str = "https://api.notion.com/v1"
+    ZAPI_BASE: str = "https://api.z-api.io"
+    HTTP_MAX_CONNECTIONS: int = 50
+    HTTP_KEEPALIVE_S: float = 60.0
 
     class Config:
         env_file = ".env"
 
 
 settings = Settings()
+log = get_logger("helpers")
 
 # ──────────────────────── NORMALIZAÇÃO AUXILIAR ─────────────────────
 def _norm(text: str | None) -> str:
@@ -88,6 +101,86 @@ def iso_or_brazil(date_str: str | None) -> str:     # ← NOVA função
     return formatar_data(txt)
 
 
+# ───────────────────────── HTTP COMPARTILHADO ───────────────────────
+# Um único AsyncClient por processo: reaproveita conexões TLS entre requests
+# (e entre vendors) em vez de abrir um pool novo a cada chamada.
+_HTTP_CLIENT: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=15,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_S,
+            ),
+        )
+    return _HTTP_CLIENT
+
+
+class _ClienteComTimeout:
+    """Fachada do cliente compartilhado que aplica um timeout padrão por chamada."""
+
+    __slots__ = ("_client", "_timeout")
+
+    def __init__(self, client: httpx.AsyncClient, timeout: float):
+        self._client = client
+        self._timeout = timeout
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        kwargs.setdefault("timeout", self._timeout)
+        return await self._client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+
+@asynccontextmanager
+async def http_client(timeout: float = 15) -> AsyncIterator[_ClienteComTimeout]:
+    """Substituto de `httpx.AsyncClient(timeout=...)` que não fecha o pool ao sair."""
+    yield _ClienteComTimeout(get_http_client(), timeout)
+
+
+async def fechar_http_client() -> None:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
+
+async def aquecer_conexoes() -> Dict[str, Any]:
+    """Abre (e deixa no pool) uma conexão com cada vendor: Notion, Asaas e Z-API."""
+    client = get_http_client()
+    origens = {
+        nome: "{0.scheme}://{0.netloc}/".format(urlsplit(base))
+        for nome, base in (
+            ("notion", settings.NOTION_BASE),
+            ("asaas", settings.ASAAS_BASE),
+            ("zapi", settings.ZAPI_BASE),
+        )
+    }
+
+    async def _abrir(nome: str, origem: str) -> tuple[str, Any]:
+        inicio = time.perf_counter()
+        try:
+            # Qualquer status serve: o objetivo é o handshake TCP/TLS ficar no pool
+            await client.head(origem, timeout=5)
+            return nome, {"ok": True, "ms": round((time.perf_counter() - inicio) * 1000, 1)}
+        except httpx.HTTPError as e:
+            return nome, {"ok": False, "erro": f"{type(e).__name__}: {e}"}
+
+    return dict(await asyncio.gather(*(_abrir(n, o) for n, o in origens.items())))
+
+
 # ──────────────────────────── NOTION ────────────────────────────────
 def _headers_notion() -> dict:
     return {
@@ -111,43 +204,190 @@ async def _get_data_source_id() -> str | None:
 
     # Descobre data_source_id via GET /v1/databases/{db}
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(
-                f"https://api.notion.com/v1/databases/{settings.NOTION_DB_ID.strip()}",
-                headers=_headers_notion(),
-            )
+        with span("notion.data_source"):
+            async with http_client(timeout=10) as client:
+                r = await client.get(
+                    f"{settings.NOTION_BASE}/databases/{settings.NOTION_DB_ID.strip()}",
+                    headers=_headers_notion(),
+                )
             r.raise_for_status()
-            data_sources = (r.json() or {}).get("data_sources", [])
+            data_sources = (loads(r.content) or {}).get("data_sources", [])
             if data_sources:
                 _CACHED_DATA_SOURCE_ID = data_sources[0].get("id")
                 return _CACHED_DATA_SOURCE_ID
     except Exception as e:
-        print("⚠️ Notion data_source discovery failed:", e)
+        log.warning("⚠️ Notion data_source discovery failed: %s", e)
     return None
 
 
-async def notion_search_by_email(email: str) -> List[dict]:
+# ───────────────────── PROJEÇÃO DE PROPRIEDADES ─────────────────────
+# Só pedimos ao Notion as propriedades que usamos (`filter_properties`), e o
+# resultado vira registros pequenos em vez de dicts aninhados da página inteira.
+ALUNO_PROPS = ("Email",)
+CONTRATO_PROPS = ("Data de Início", "Duração em meses", "Dia da Semana das aulas")
+NOME_PROPS = ("Nome", "Student Name", "Name")
+
+_PROPERTY_IDS: Dict[str, Dict[str, str]] = {}
+
+
+async def notion_property_ids(data_source_id: str | None, nomes: Sequence[str]) -> List[str] | None:
+    """IDs (para filter_properties) das propriedades pedidas; None se não der para resolver."""
+    if not data_source_id:
+        return None
+    ds = data_source_id.strip()
+    esquema = _PROPERTY_IDS.get(ds)
+    if esquema is None:
+        try:
+            with span("notion.schema"):
+                async with http_client(timeout=10) as client:
+                    r = await client.get(f"{settings.NOTION_BASE}/data_sources/{ds}", headers=_headers_notion())
+            r.raise_for_status()
+            esquema = {
+                nome: prop["id"]
+                for nome, prop in (loads(r.content).get("properties") or {}).items()
+                if prop.get("id")
+            }
+            _PROPERTY_IDS[ds] = esquema
+        except (httpx.HTTPError, ValueError) as e:
+            log.warning("⚠️ Notion schema lookup failed: %s", e)
+            return None
+    ids = [esquema[n] for n in nomes if n in esquema]
+    return ids or None
+
+
+def _texto(prop: dict | None) -> str | None:
+    itens = (prop or {}).get("title") or (prop or {}).get("rich_text") or []
+    return "".join(i.get("plain_text") or (i.get("text") or {}).get("content", "") for i in itens) or None
+
+
+@dataclass(slots=True)
+class AlunoNotion:
+    id: str
+    email: str | None
+
+    @classmethod
+    def from_page(cls, page: dict) -> "AlunoNotion":
+        return cls(page["id"], (page.get("properties") or {}).get("Email", {}).get("email"))
+
+
+@dataclass(slots=True)
+class ContratoNotion:
+    id: str
+    data_inicio: str | None
+    duracao_meses: int | None
+    dia_aula: str | None
+
+    @classmethod
+    def from_page(cls, page: dict) -> "ContratoNotion":
+        props = page.get("properties") or {}
+        duracao = (props.get("Duração em meses") or {}).get("number")
+        return cls(
+            page["id"],
+            ((props.get("Data de Início") or {}).get("date") or {}).get("start"),
+            int(duracao) if duracao is not None else None,
+            ((props.get("Dia da Semana das aulas") or {}).get("select") or {}).get("name"),
+        )
+
+
+@dataclass(slots=True)
+class PaginaNome:
+    id: str
+    nome: str | None
+
+    @classmethod
+    def from_page(cls, page: dict) -> "PaginaNome":
+        props = page.get("properties") or {}
+        prop = next((props[n] for n in NOME_PROPS if n in props), None)
+        return cls(page["id"], _texto(prop))
+
+
+NOTION_MAX_PAGE_SIZE = 100
+
+
+async def notion_query_iter(
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    data_source_id: str | None = None,
+    database_id: str | None = None,
+    page_size: int = NOTION_MAX_PAGE_SIZE,
+    limit: int | None = None,
+    timeout: float = 15,
+    projecao: Sequence[str] | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Itera as páginas de uma query do Notion seguindo has_more/next_cursor.
+
+    Enquanto o chamador consome o lote N, o lote N+1 já está sendo buscado.
+    `limit` encerra cedo (e não pede lotes além do necessário). Quem sai do
+    `async for` antes do fim (break) deve usar `contextlib.aclosing`: o fechamento
+    do gerador é o que cancela a busca antecipada pendente. `projecao` (nomes de
+    propriedades) restringe a resposta via filter_properties.
+    """
+    if data_source_id:
+        url = f"{settings.NOTION_BASE}/data_sources/{data_source_id.strip()}/query"
+    elif database_id:
+        # Fallback legacy (single-source dbs may still work)
+        url = f"{settings.NOTION_BASE}/databases/{database_id.strip()}/query"
+    else:
+        raise ValueError("Informe data_source_id ou database_id")
+
+    base = dict(payload or {})
+    base["page_size"] = max(1, min(page_size, NOTION_MAX_PAGE_SIZE))
+    if limit is not None:
+        base["page_size"] = min(base["page_size"], limit)
+    ids = await notion_property_ids(data_source_id, projecao) if projecao else None
+    params = [("filter_properties", i) for i in ids] if ids else None
+
+    async with http_client(timeout=timeout) as client:
+
+        async def _buscar(cursor: str | None) -> dict:
+            body = {**base, "start_cursor": cursor} if cursor else base
+            with span("notion.query.page"):
+                r = await client.post(url, headers=_headers_notion(), params=params, content=dumps(body))
+            r.raise_for_status()
+            return loads(r.content)
+
+        entregues = 0
+        proximo: asyncio.Task | None = asyncio.create_task(_buscar(None))
+        try:
+            while proximo is not None:
+                lote = await proximo
+                proximo = None
+                resultados = lote.get("results", [])
+                restantes = None if limit is None else limit - entregues - len(resultados)
+                if lote.get("has_more") and lote.get("next_cursor") and (restantes is None or restantes > 0):
+                    proximo = asyncio.create_task(_buscar(lote["next_cursor"]))
+                for pagina in resultados:
+                    if limit is not None and entregues >= limit:
+                        return
+                    entregues += 1
+                    yield pagina
+        finally:
+            if proximo is not None and not proximo.done():
+                proximo.cancel()
+                try:
+                    await proximo
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+
+async def notion_search_by_email(email: str) -> List[AlunoNotion]:
     payload = {
         "filter": {"property": "Email", "email": {"equals": email.strip().lower()}},
-        "page_size": 1,
     }
     data_source_id = await _get_data_source_id()
-    async with httpx.AsyncClient(timeout=10) as client:
-        if data_source_id:
-            r = await client.post(
-                f"https://api.notion.com/v1/data_sources/{data_source_id.strip()}/query",
-                headers=_headers_notion(),
-                json=payload,
-            )
-        else:
-            # Fallback legacy (single-source dbs may still work)
-            r = await client.post(
-                f"https://api.notion.com/v1/databases/{settings.NOTION_DB_ID.strip()}/query",
-                headers=_headers_notion(),
-                json=payload,
+    with span("notion.search"):
+        return [
+            AlunoNotion.from_page(pagina)
+            async for pagina in notion_query_iter(
+                payload,
+                data_source_id=data_source_id,
+                database_id=settings.NOTION_DB_ID,
+                limit=1,
+                timeout=10,
+                projecao=ALUNO_PROPS,
             )
-        r.raise_for_status()
-        return r.json().get("results", [])
+        ]
 
 
 def _build_props(data: dict) -> dict:
@@ -185,33 +425,36 @@ async def notion_create_page(data: dict) -> None:
         "parent": parent,
         "properties": {"Email": {"email": data["email"]}, **_build_props(data)},
     }
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post("https://api.notion.com/v1/pages", headers=_headers_notion(), json=payload)
-        if r.status_code != 200:
-            print("❌ Notion create error:", r.text)
-        r.raise_for_status()
+    with span("notion.create"):
+        async with http_client(timeout=10) as client:
+            r = await client.post(f"{settings.NOTION_BASE}/pages", headers=_headers_notion(), content=dumps(payload))
+            if r.status_code != 200:
+                log.error("❌ Notion create error: %s", r.text, extra=campos(status=r.status_code))
+            r.raise_for_status()
 
 
 async def notion_update_page(page_id: str, data: dict) -> None:
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.patch(
-            f"https://api.notion.com/v1/pages/{page_id}",
-            headers=_headers_notion(),
-            json={"properties": _build_props(data)},
-        )
-        if r.status_code != 200:
-            print("❌ Notion update error:", r.text)
-        r.raise_for_status()
+    with span("notion.update", page_id=page_id):
+        async with http_client(timeout=10) as client:
+            r = await client.patch(
+                f"{settings.NOTION_BASE}/pages/{page_id}",
+                headers=_headers_notion(),
+                content=dumps({"properties": _build_props(data)}),
+            )
+            if r.status_code != 200:
+                log.error("❌ Notion update error: %s", r.text, extra=campos(status=r.status_code, page_id=page_id))
+            r.raise_for_status()
 
 
 async def upsert_student(data: dict) -> str:
-    resultado = await notion_search_by_email(data["email"])
-    if resultado:
-        page_id = resultado[0]["id"]
-        await notion_update_page(page_id, data)
-        return page_id
-    await notion_create_page(data)
-    return ""
+    with span("notion.upsert"):
+        resultado = await notion_search_by_email(data["email"])
+        if resultado:
+            page_id = resultado[0].id
+            await notion_update_page(page_id, data)
+            return page_id
+        await notion_create_page(data)
+        return ""
 
 
 # ─────────── Anti-duplicação de WhatsApp (TTL 5 min por número) ─────
@@ -232,7 +475,7 @@ def _can_send(numero: str) -> bool:
 async def send_whatsapp_message(name: str, email: str, phone: str, novo: bool, fim_contrato_text: str | None = None) -> None:
     numero = limpar_telefone(phone)
     if len(numero) != 11:
-        print(f"⚠️ Telefone inválido: {numero}")
+        log.warning("⚠️ Telefone inválido: %s", numero)
         return
 
     first_name = (name or "").strip().split(" ")[0] if name else ""
@@ -263,35 +506,37 @@ async def send_whatsapp_message(name: str, email: str, phone: str, novo: bool, f
             msg = corpo_base + " See you!"
 
     if not _can_send(numero):
-        print("ℹ️ WhatsApp já enviado recentemente – ignorado")
+        log.info("ℹ️ WhatsApp já enviado recentemente – ignorado")
         return
 
     payload = {"phone": numero, "message": msg}
-    url = f"https://api.z-api.io/instances/{settings.ZAPI_INSTANCE_ID}/token/{settings.ZAPI_TOKEN}/send-text"
+    url = f"{settings.ZAPI_BASE}/instances/{settings.ZAPI_INSTANCE_ID}/token/{settings.ZAPI_TOKEN}/send-text"
     headers = {"Content-Type": "application/json", "Client-Token": settings.ZAPI_SECURITY_TOKEN}
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        if r.status_code == 200:
-            print("✅ WhatsApp enviado")
-        else:
-            print("❌ WhatsApp erro:", r.text)
+    with span("whatsapp.send"):
+        async with http_client(timeout=10) as client:
+            r = await client.post(url, headers=headers, content=dumps(payload))
+            if r.status_code == 200:
+                log.info("✅ WhatsApp enviado")
+            else:
+                log.error("❌ WhatsApp erro: %s", r.text, extra=campos(status=r.status_code))
 
 
 # ───────────────────────────── ASAAS ────────────────────────────────
 async def criar_assinatura_asaas(data: dict):
     headers = {"Content-Type": "application/json", "access-token": settings.ASAAS_API_KEY}
-    async with httpx.AsyncClient(timeout=10) as client:
-        print(f"🔍 Buscando cliente no Asaas: {data['email']}")
-        r = await client.get(f"{settings.ASAAS_BASE}/customers", headers=headers, params={"email": data["email"]})
-        print(f"📡 Status busca cliente: {r.status_code}")
+    async with http_client(timeout=10) as client:
+        log.info("🔍 Buscando cliente no Asaas: %s", data["email"])
+        with span("asaas.customers.get"):
+            r = await client.get(f"{settings.ASAAS_BASE}/customers", headers=headers, params={"email": data["email"]})
+        log.debug("📡 Status busca cliente: %s", r.status_code)
         if r.status_code != 200:
-            print(f"❌ Erro ao buscar cliente: {r.text}")
+            log.error("❌ Erro ao buscar cliente: %s", r.text, extra=campos(status=r.status_code))
         r.raise_for_status()
-        clientes = r.json().get("data", [])
+        clientes = loads(r.content).get("data", [])
         if clientes:
             customer_id = clientes[0]["id"]
-            print(f"✅ Cliente encontrado: {customer_id}")
+            log.info("✅ Cliente encontrado: %s", customer_id)
         else:
             payload = {
                 "name": data["nome"],
@@ -299,24 +544,27 @@ async def criar_assinatura_asaas(data: dict):
                 "mobilePhone": limpar_telefone(data["telefone"]),
                 "cpfCnpj": re.sub(r"\D", "", data["cpf"]),
             }
-            print(f"👤 Criando cliente: {payload}")
-            r = await client.post(f"{settings.ASAAS_BASE}/customers", headers=headers, json=payload)
-            print(f"📡 Status criação cliente: {r.status_code}")
+            log.info("👤 Criando cliente", extra=campos(payload=payload_vendor(payload)))
+            with span("asaas.customers.create"):
+                r = await client.post(f"{settings.ASAAS_BASE}/customers", headers=headers, content=dumps(payload))
+            log.debug("📡 Status criação cliente: %s", r.status_code)
             if r.status_code != 200:
-                print(f"❌ Erro ao criar cliente: {r.text}")
+                log.error("❌ Erro ao criar cliente: %s", r.text, extra=campos(status=r.status_code))
             r.raise_for_status()
-            customer_id = r.json()["id"]
-            print(f"✅ Cliente criado: {customer_id}")
+            customer_id = loads(r.content)["id"]
+            log.info("✅ Cliente criado: %s", customer_id)
 
-        r = await client.get(
-            f"{settings.ASAAS_BASE}/subscriptions",
-            headers=headers,
-            params={"customer": customer_id, "status": "ACTIVE"},
-        )
+        with span("asaas.subscriptions.get"):
+            r = await client.get(
+                f"{settings.ASAAS_BASE}/subscriptions",
+                headers=headers,
+                params={"customer": customer_id, "status": "ACTIVE"},
+            )
         r.raise_for_status()
-        if r.json().get("data"):
-            print("ℹ️ Assinatura já existe — nada a criar.")
-            return r.json()["data"][0]
+        existentes = loads(r.content).get("data")
+        if existentes:
+            log.info("ℹ️ Assinatura já existe — nada a criar.")
+            return existentes[0]
 
         assinatura = {
             "customer": customer_id,
@@ -331,9 +579,10 @@ async def criar_assinatura_asaas(data: dict):
             "notificationDisabled": False,
             "externalReference": f"{data['email']}-{data.get('vencimento','')}",
         }
-        r = await client.post(f"{settings.ASAAS_BASE}/subscriptions", headers=headers, json=assinatura)
+        with span("asaas.subscriptions.create"):
+            r = await client.post(f"{settings.ASAAS_BASE}/subscriptions", headers=headers, content=dumps(assinatura))
         if r.status_code != 200:
-            print("❌ Asaas erro:", r.text)
+            log.error("❌ Asaas erro: %s", r.text, extra=campos(status=r.status_code))
         r.raise_for_status()
-        print("✅ Assinatura criada")
-        return r.json()
+        log.info("✅ Assinatura criada")
+        return loads(r.content)
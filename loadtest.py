@@ -0,0 +1,495 @@
+# ~/Downloads/OnboardingKarol/loadtest.py
+# Harness de carga offline: sobe dublês locais de Notion, Asaas, Z-API e Flexge
+# e dispara o app contra eles numa taxa (QPS) alvo.
+#
+# Uso:
+#   python loadtest.py --cenario webhook --qps 20 --duracao 30
+#   python loadtest.py --cenario calculo --qps 2 --notion-paginas 200 --latencia-ms 150
+#   python loadtest.py --cenario flexge --qps 0.5 --flexge-total-docs 5000 --taxa-429 0.05
+#
+# Nada sai da máquina: o app roda num subprocesso uvicorn com NOTION_BASE,
+# ASAAS_BASE, ZAPI_BASE e FLEXGE_URL apontando para os dublês.
+#
+# Latências p50/p95/p99 contam só respostas 2xx; recusas do controle de admissão
+# (429/503) saem em "recusadas" e em "latencia_por_status". ADMISSAO_* do ambiente
+# é ignorado (valem os padrões do app) e só muda via --admissao:
+#   python loadtest.py --cenario calculo --qps 5 --admissao EXECUTAR_LIMITE=4 --admissao EXECUTAR_FILA=8
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+HOST = "127.0.0.1"
+
+
+# ─────────────────────────── CONFIG DOS DUBLÊS ──────────────────────
+@dataclass
+class StandInConfig:
+    latencia_ms: float = 80.0
+    jitter_ms: float = 20.0
+    taxa_erro: float = 0.0          # fração de respostas 500
+    taxa_429: float = 0.0           # fração de respostas 429
+    retry_after: int = 1            # segundos enviados no header Retry-After
+    notion_paginas: int = 50        # páginas devolvidas pelas queries do Notion
+    notion_match_email: float = 0.5 # fração de buscas por e-mail que acham aluno
+    flexge_total_docs: int = 500
+    flexge_page_size: int = 50
+
+
+_CONTADORES: Counter = Counter()
+_LOCK_CONTADORES = threading.Lock()
+
+
+_RE_ID = re.compile(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def _contar(chave: str) -> None:
+    with _LOCK_CONTADORES:
+        _CONTADORES[chave] += 1
+
+
+def _novo_app(vendor: str, cfg: StandInConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def _simula_rede(request: Request, call_next):
+        _contar(f"{vendor} {request.method} {_RE_ID.sub('/{id}', request.url.path)}")
+        await asyncio.sleep(max(0.0, random.gauss(cfg.latencia_ms, cfg.jitter_ms)) / 1000)
+        sorteio = random.random()
+        if sorteio < cfg.taxa_429:
+            _contar(f"{vendor} 429")
+            return JSONResponse(
+                {"message": "rate limited"},
+                status_code=429,
+                headers={"Retry-After": str(cfg.retry_after)},
+            )
+        if sorteio < cfg.taxa_429 + cfg.taxa_erro:
+            _contar(f"{vendor} 500")
+            return JSONResponse({"message": "stand-in error"}, status_code=500)
+        return await call_next(request)
+
+    return app
+
+
+def _pagina_notion(i: int, email: str | None = None) -> dict:
+    inicio = f"2025-{(i % 12) + 1:02d}-{(i % 27) + 1:02d}"
+    return {
+        "object": "page",
+        "id": str(uuid.UUID(int=i + 1)),
+        "properties": {
+            "Student Name": {"type": "title", "title": [{"text": {"content": f"Aluno {i}"}}]},
+            "Nome": {"type": "title", "title": [{"text": {"content": f"Aluno {i}"}}]},
+            "Email": {"type": "email", "email": email or f"aluno{i}@loadtest.local"},
+            "Data de Início": {"type": "date", "date": {"start": inicio}},
+            "Duração em meses": {"type": "number", "number": 6 if i % 2 else 12},
+            "Dia da Semana das aulas": {
+                "type": "select",
+                "select": {"name": ["Segunda", "Terça", "Quarta", "Quinta", "Sexta"][i % 5]},
+            },
+            "Horas de Estudo": {"type": "rich_text", "rich_text": [{"text": {"content": "1h 0m"}}]},
+        },
+    }
+
+
+_PROP_IDS = {nome: f"p{i}" for i, nome in enumerate(_pagina_notion(0)["properties"])}
+
+
+def notion_app(cfg: StandInConfig) -> FastAPI:
+    app = _novo_app("notion", cfg)
+
+    @app.get("/v1/databases/{db_id}")
+    async def get_database(db_id: str):
+        return {"object": "database", "id": db_id, "data_sources": [{"id": f"ds-{db_id}"}]}
+
+    @app.get("/v1/data_sources/{ds_id}")
+    async def get_data_source(ds_id: str):
+        props = _pagina_notion(0)["properties"]
+        return {"object": "data_source", "id": ds_id,
+                "properties": {nome: {"id": _PROP_IDS[nome], "name": nome} for nome in props}}
+
+    def _projetar(pagina: dict, ids: List[str]) -> dict:
+        if ids:
+            pagina["properties"] = {n: p for n, p in pagina["properties"].items() if _PROP_IDS[n] in ids}
+        return pagina
+
+    async def _query(request: Request) -> dict:
+        body = await request.json() if await request.body() else {}
+        ids = request.query_params.getlist("filter_properties")
+        email = (((body.get("filter") or {}).get("email")) or {}).get("equals")
+        if email:
+            achou = random.random() < cfg.notion_match_email
+            return {"results": [_projetar(_pagina_notion(0, email), ids)] if achou else [],
+                    "has_more": False, "next_cursor": None}
+        page_size = min(int(body.get("page_size") or 100), 100)
+        inicio = int(body.get("start_cursor") or 0)
+        fim = min(inicio + page_size, cfg.notion_paginas)
+        has_more = fim < cfg.notion_paginas
+        return {
+            "results": [_projetar(_pagina_notion(i), ids) for i in range(inicio, fim)],
+            "has_more": has_more,
+            "next_cursor": str(fim) if has_more else None,
+        }
+
+    @app.post("/v1/data_sources/{ds_id}/query")
+    async def query_data_source(ds_id: str, request: Request):
+        return await _query(request)
+
+    @app.post("/v1/databases/{db_id}/query")
+    async def query_database(db_id: str, request: Request):
+        return await _query(request)
+
+    @app.post("/v1/pages")
+    async def create_page(request: Request):
+        return {"object": "page", "id": str(uuid.uuid4())}
+
+    @app.patch("/v1/pages/{page_id}")
+    async def update_page(page_id: str, request: Request):
+        return {"object": "page", "id": page_id}
+
+    return app
+
+
+def asaas_app(cfg: StandInConfig) -> FastAPI:
+    app = _novo_app("asaas", cfg)
+
+    @app.get("/v3/customers")
+    async def list_customers(email: str = ""):
+        achou = random.random() < 0.5
+        return {"data": [{"id": "cus_existente", "email": email}] if achou else []}
+
+    @app.post("/v3/customers")
+    async def create_customer(request: Request):
+        return {"id": f"cus_{uuid.uuid4().hex[:12]}"}
+
+    @app.get("/v3/subscriptions")
+    async def list_subscriptions(customer: str = ""):
+        return {"data": []}
+
+    @app.post("/v3/subscriptions")
+    async def create_subscription(request: Request):
+        return {"id": f"sub_{uuid.uuid4().hex[:12]}", **(await request.json())}
+
+    return app
+
+
+def zapi_app(cfg: StandInConfig) -> FastAPI:
+    app = _novo_app("zapi", cfg)
+
+    @app.post("/instances/{instance}/token/{token}/send-text")
+    async def send_text(instance: str, token: str):
+        return {"zaapId": uuid.uuid4().hex, "messageId": uuid.uuid4().hex}
+
+    return app
+
+
+def flexge_app(cfg: StandInConfig) -> FastAPI:
+    app = _novo_app("flexge", cfg)
+
+    @app.get("/external/students")
+    async def students(page: int = 1):
+        inicio = (page - 1) * cfg.flexge_page_size
+        fim = min(inicio + cfg.flexge_page_size, cfg.flexge_total_docs)
+        docs = [
+            {
+                "id": f"st{i}",
+                "name": f"Aluno Flexge {i}",
+                "weekTime": {"studiedTime": (i * 137) % 7200},
+                "executions": [{"studiedTime": (i * 53) % 1800}],
+            }
+            for i in range(inicio, fim)
+        ]
+        return {"docs": docs, "totalDocs": cfg.flexge_total_docs, "page": page}
+
+    return app
+
+
+# ─────────────────────────── INFRA LOCAL ────────────────────────────
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def _subir_dubles(cfg: StandInConfig) -> Dict[str, int]:
+    """Sobe os quatro dublês numa thread própria (loop separado do driver)."""
+    apps = {
+        "notion": notion_app(cfg),
+        "asaas": asaas_app(cfg),
+        "zapi": zapi_app(cfg),
+        "flexge": flexge_app(cfg),
+    }
+    portas = {nome: _porta_livre() for nome in apps}
+    servidores = [
+        uvicorn.Server(uvicorn.Config(app, host=HOST, port=portas[nome], log_level="warning"))
+        for nome, app in apps.items()
+    ]
+
+    async def _servir():
+        await asyncio.gather(*(s.serve() for s in servidores))
+
+    threading.Thread(target=lambda: asyncio.run(_servir()), daemon=True).start()
+    limite = time.time() + 10
+    while not all(s.started for s in servidores):
+        if time.time() > limite:
+            raise RuntimeError("dublês não subiram em 10s")
+        time.sleep(0.05)
+    return portas
+
+
+def _subir_app(portas: Dict[str, int], admissao: Optional[Dict[str, str]] = None) -> tuple[subprocess.Popen, str]:
+    porta = _porta_livre()
+    # Histórico Flexge e traces do teste ficam num diretório próprio, longe dos arquivos reais
+    dados = tempfile.mkdtemp(prefix="loadtest-")
+    atexit.register(shutil.rmtree, dados, True)
+    env = {
+        # ADMISSAO_* do shell mudaria os números sem aparecer no relatório
+        **{k: v for k, v in os.environ.items() if not k.startswith("ADMISSAO_")},
+        **{f"ADMISSAO_{k}": v for k, v in (admissao or {}).items()},
+        "NOTION_TOKEN": "loadtest",
+        "NOTION_DB_ID": "db-alunos",
+        "NOTION_DATA_SOURCE_ID": "",
+        "ZAPI_INSTANCE_ID": "loadtest",
+        "ZAPI_TOKEN": "loadtest",
+        "ZAPI_SECURITY_TOKEN": "loadtest",
+        "ASAAS_API_KEY": "loadtest",
+        "FLEXGE_API_KEY": "loadtest",
+        "CALC_DATABASE_ID": "db-calculo",
+        "NOTION_BASE": f"http://{HOST}:{portas['notion']}/v1",
+        "ASAAS_BASE": f"http://{HOST}:{portas['asaas']}/v3",
+        "ZAPI_BASE": f"http://{HOST}:{portas['zapi']}",
+        "FLEXGE_URL": f"http://{HOST}:{portas['flexge']}/external/students",
+        "FLEXGE_HISTORY_FILE": os.path.join(dados, "flexge_history.bin"),
+        "TRACE_FILE": os.path.join(dados, "traces.jsonl"),
+        "NOTION_WRITE_BEHIND_MS": "0",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", HOST, "--port", str(porta),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base = f"http://{HOST}:{porta}"
+    limite = time.time() + 30
+    while time.time() < limite:
+        if proc.poll() is not None:
+            raise RuntimeError("app terminou antes de responder — veja stderr acima")
+        try:
+            if httpx.get(f"{base}/", timeout=1).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("app não respondeu em 30s")
+
+
+# ─────────────────────────── CARGA SINTÉTICA ────────────────────────
+def payload_zapsign(i: int) -> dict:
+    return {
+        "status": "signed",
+        "signer_who_signed": {
+            "name": f"Aluno Carga {i}",
+            "email": f"carga{i}@loadtest.local",
+            "phone_country": "55",
+            "phone_number": f"11{900000000 + i:09d}"[-11:],
+        },
+        "answers": [
+            {"variable": "tipo do pacote", "value": random.choice(["VIP", "Light", "Flexge"])},
+            {"variable": "tempo de contrato", "value": random.choice(["Anual", "Semestral"])},
+            {"variable": "Data do primeiro pagamento", "value": "10/01/2026"},
+            {"variable": "Data último pagamento", "value": "10/12/2026"},
+            {"variable": "data inicio do contrato", "value": "05/01/2026"},
+            {"variable": "data do término do contrato", "value": "05/01/2027"},
+            {"variable": "data de nascimento", "value": "01/02/1990"},
+            {"variable": "cpf", "value": f"{i:011d}"},
+            {"variable": "R$valor das parcelas", "value": "R$ 1.250,00"},
+            {"variable": "endereço completo", "value": "Rua Teste, 123 - São Paulo/SP"},
+        ],
+    }
+
+
+CENARIOS = {
+    "webhook": ("POST", "/webhook/zapsign", payload_zapsign),
+    "calculo": ("POST", "/calculo/executar", lambda i: None),
+    "flexge": ("POST", "/lista-flexge-semanal/", lambda i: {"phone_number": "5511999999999"}),
+}
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+async def _disparar(base: str, cenario: str, qps: float, duracao: float, timeout: float) -> dict:
+    metodo, rota, gerar = CENARIOS[cenario]
+    latencias: Dict[str, List[float]] = {}
+    status: Counter = Counter()
+    total = max(1, int(qps * duracao))
+
+    async with httpx.AsyncClient(base_url=base, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        async def _uma(i: int):
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(metodo, rota, json=gerar(i))
+                chave = str(r.status_code)
+            except httpx.HTTPError as e:
+                chave = type(e).__name__
+            status[chave] += 1
+            latencias.setdefault(chave, []).append((time.perf_counter() - t0) * 1000)
+
+        # Loop aberto: as chegadas seguem o relógio, não a conclusão das anteriores
+        inicio = time.perf_counter()
+        tarefas = []
+        for i in range(total):
+            atraso = inicio + i / qps - time.perf_counter()
+            if atraso > 0:
+                await asyncio.sleep(atraso)
+            tarefas.append(asyncio.create_task(_uma(i)))
+        await asyncio.gather(*tarefas)
+        decorrido = time.perf_counter() - inicio
+
+    # Recusas do controle de admissão voltam em ~1ms e puxariam os percentis para baixo
+    sucesso = [ms for chave, valores in latencias.items() if chave.startswith("2") for ms in valores]
+    return {
+        "cenario": cenario,
+        "rota": f"{metodo} {rota}",
+        "qps_alvo": qps,
+        "requisicoes": total,
+        "duracao_s": round(decorrido, 3),
+        "throughput_rps": round(total / decorrido, 2) if decorrido else 0.0,
+        "sucesso": len(sucesso),
+        "recusadas": status["429"] + status["503"],
+        "p50_ms": round(_percentil(sucesso, 50), 1),
+        "p95_ms": round(_percentil(sucesso, 95), 1),
+        "p99_ms": round(_percentil(sucesso, 99), 1),
+        "max_ms": round(max(sucesso, default=0.0), 1),
+        "status": dict(sorted(status.items())),
+        "latencia_por_status": {
+            chave: {
+                "p50_ms": round(_percentil(valores, 50), 1),
+                "p95_ms": round(_percentil(valores, 95), 1),
+                "p99_ms": round(_percentil(valores, 99), 1),
+            }
+            for chave, valores in sorted(latencias.items())
+        },
+    }
+
+
+def executar(cenario: str, qps: float, duracao: float, cfg: StandInConfig,
+             timeout: float = 60.0, base: Optional[str] = None,
+             admissao: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Roda um cenário e devolve o relatório (latências, throughput e chamadas externas).
+    `admissao` ({"CALCULO_LIMITE": "8", ...}) vira ADMISSAO_* do app; vale só quando
+    o app é subido aqui (sem `base`).
+    """
+    proc = None
+    if base is None:
+        portas = _subir_dubles(cfg)
+        proc, base = _subir_app(portas, admissao)
+    try:
+        with _LOCK_CONTADORES:
+            _CONTADORES.clear()
+        relatorio = asyncio.run(_disparar(base, cenario, qps, duracao, timeout))
+        with _LOCK_CONTADORES:
+            chamadas = dict(sorted(_CONTADORES.items()))
+        relatorio["chamadas_externas"] = chamadas
+        relatorio["chamadas_externas_total"] = sum(
+            v for k, v in chamadas.items() if not k.endswith((" 429", " 500"))
+        )
+        relatorio["dubles"] = asdict(cfg)
+        relatorio["admissao"] = dict(admissao or {})
+        return relatorio
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+def _imprimir(rel: Dict[str, Any]) -> None:
+    print(f"\n📈 {rel['cenario']} — {rel['rota']} @ {rel['qps_alvo']} QPS")
+    print(f"   requisições: {rel['requisicoes']} em {rel['duracao_s']}s "
+          f"→ {rel['throughput_rps']} req/s")
+    print(f"   latência 2xx ({rel['sucesso']}): p50 {rel['p50_ms']}ms · p95 {rel['p95_ms']}ms · "
+          f"p99 {rel['p99_ms']}ms · máx {rel['max_ms']}ms")
+    print(f"   status: {rel['status']} — {rel['recusadas']} recusadas pela admissão")
+    for chave, lat in rel["latencia_por_status"].items():
+        print(f"     {chave:>16}: p50 {lat['p50_ms']}ms · p95 {lat['p95_ms']}ms · p99 {lat['p99_ms']}ms")
+    print(f"   admissão: {rel['admissao'] or 'padrões do app'}")
+    print(f"   chamadas externas ({rel['chamadas_externas_total']}):")
+    for chave, n in rel["chamadas_externas"].items():
+        print(f"     {n:6d}  {chave}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Teste de carga offline com dublês de Notion/Asaas/Z-API/Flexge")
+    p.add_argument("--cenario", choices=sorted(CENARIOS), default="webhook")
+    p.add_argument("--qps", type=float, default=10.0)
+    p.add_argument("--duracao", type=float, default=10.0, help="segundos de disparo")
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.add_argument("--latencia-ms", type=float, default=StandInConfig.latencia_ms)
+    p.add_argument("--jitter-ms", type=float, default=StandInConfig.jitter_ms)
+    p.add_argument("--taxa-erro", type=float, default=StandInConfig.taxa_erro)
+    p.add_argument("--taxa-429", type=float, default=StandInConfig.taxa_429)
+    p.add_argument("--retry-after", type=int, default=StandInConfig.retry_after)
+    p.add_argument("--notion-paginas", type=int, default=StandInConfig.notion_paginas)
+    p.add_argument("--notion-match-email", type=float, default=StandInConfig.notion_match_email)
+    p.add_argument("--flexge-total-docs", type=int, default=StandInConfig.flexge_total_docs)
+    p.add_argument("--flexge-page-size", type=int, default=StandInConfig.flexge_page_size)
+    p.add_argument("--admissao", action="append", default=[], metavar="NOME=VALOR",
+                   help="repassa ADMISSAO_<NOME> ao app (ex.: CALCULO_LIMITE=8); repetível")
+    p.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = p.parse_args(argv)
+
+    admissao = {}
+    for item in args.admissao:
+        nome, sep, valor = item.partition("=")
+        if not sep:
+            p.error(f"--admissao espera NOME=VALOR, recebeu '{item}'")
+        admissao[nome.strip().upper().removeprefix("ADMISSAO_")] = valor.strip()
+
+    cfg = StandInConfig(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        taxa_erro=args.taxa_erro,
+        taxa_429=args.taxa_429,
+        retry_after=args.retry_after,
+        notion_paginas=args.notion_paginas,
+        notion_match_email=args.notion_match_email,
+        flexge_total_docs=args.flexge_total_docs,
+        flexge_page_size=args.flexge_page_size,
+    )
+    rel = executar(args.cenario, args.qps, args.duracao, cfg, timeout=args.timeout, admissao=admissao)
+    if args.json:
+        print(json.dumps(rel, ensure_ascii=False, indent=2))
+    else:
+        _imprimir(rel)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
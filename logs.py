@@ -0,0 +1,147 @@
+# ~/Downloads/OnboardingKarol/logs.py
+# Logging estruturado e não bloqueante.
+#
+# Os handlers do request só enfileiram o LogRecord (QueueHandler); a formatação
+# em JSON e a escrita no stdout acontecem numa thread (QueueListener). Cada linha
+# é um JSON no formato que o Cloud Logging entende (severity, message, ...).
+#
+# Variáveis:
+#   LOG_LEVEL            DEBUG | INFO | WARNING | ERROR   (padrão INFO)
+#   LOG_SAMPLE_RATE      fração das mensagens "por item" que saem (padrão 0.05)
+#   LOG_VENDOR_PAYLOADS  true para logar payloads enviados aos vendors (padrão false)
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from fastjson import dumps
+from tracing import current_trace_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.05"))
+LOG_VENDOR_PAYLOADS = os.getenv("LOG_VENDOR_PAYLOADS", "false").lower() in ("1", "true", "yes")
+
+_RAIZ = "onboarding"
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos extras passados em `campos`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entrada: Dict[str, Any] = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "logger": record.name,
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entrada["trace_id"] = trace_id
+        campos = getattr(record, "campos", None)
+        if campos:
+            entrada.update(campos)
+        if record.exc_info:
+            entrada["exception"] = self.formatException(record.exc_info)
+        return dumps(entrada).decode("utf-8")
+
+
+class _Contexto(logging.Filter):
+    """Anexa o trace corrente (o contextvar só existe na thread do request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+class _Amostragem(logging.Filter):
+    """
+    Deixa passar 1 a cada N registros marcados com `amostra=<chave>` (N = 1/LOG_SAMPLE_RATE).
+    Roda antes de enfileirar, então o que é descartado não custa formatação.
+    """
+
+    def __init__(self, taxa: float):
+        super().__init__()
+        self.a_cada = max(1, round(1 / taxa)) if taxa > 0 else 0
+        self._contagem: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        chave = getattr(record, "amostra", None)
+        if chave is None:
+            return True
+        if not self.a_cada:
+            return False
+        with self._lock:
+            n = self._contagem.get(chave, 0)
+            self._contagem[chave] = n + 1
+        return n % self.a_cada == 0
+
+
+class _Fila(logging.handlers.QueueHandler):
+    """
+    Enfileira o registro cru. O QueueHandler padrão formata na thread do request
+    e descarta exc_info; aqui só a mensagem é montada (os args podem mudar depois),
+    e o JSON e o traceback ficam para a thread do listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configurar_logging() -> None:
+    """Instala fila + listener no logger raiz do serviço (idempotente)."""
+    global _listener
+    if _listener:
+        return
+    raiz = logging.getLogger(_RAIZ)
+    raiz.setLevel(LOG_LEVEL)
+    raiz.propagate = False
+
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(JsonFormatter())
+    fila: queue.SimpleQueue = queue.SimpleQueue()
+    enfileirar = _Fila(fila)
+    enfileirar.addFilter(_Amostragem(LOG_SAMPLE_RATE))
+    enfileirar.addFilter(_Contexto())
+    raiz.addHandler(enfileirar)
+
+    _listener = logging.handlers.QueueListener(fila, saida)
+    _listener.start()
+    atexit.register(encerrar_logging)
+
+
+def encerrar_logging() -> None:
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(nome: str) -> logging.Logger:
+    return logging.getLogger(f"{_RAIZ}.{nome}")
+
+
+def amostrado(chave: str, **campos: Any) -> Dict[str, Any]:
+    """`extra=` para mensagens por item (ex.: uma linha por aluno do Flexge)."""
+    return {"amostra": chave, "campos": campos}
+
+
+def campos(**valores: Any) -> Dict[str, Any]:
+    """`extra=` com campos estruturados adicionais."""
+    return {"campos": valores}
+
+
+def payload_vendor(payload: Dict[str, Any]) -> Any:
+    """O payload completo só com LOG_VENDOR_PAYLOADS=true; senão apenas as chaves."""
+    return payload if LOG_VENDOR_PAYLOADS else sorted(payload)
@@ -1,12 +1,16 @@
 # ~/Downloads/OnboardingKarol/main.py
 # Versão 2025-06-06 — revisada, envia datas brutas ao Asaas.
 
+import asyncio
 import re
 import os
+import time
+from contextlib import aclosing, asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Any, Dict, Union
+from typing import AsyncIterator, List, Any, Dict, Sequence, Union
 import httpx
 import requests
 from dotenv import load_dotenv
@@ -18,6 +22,11 @@ from dotenv import load_dotenv
 # Carrega variáveis de ambiente do .env
 load_dotenv()
 
+from logs import configurar_logging, encerrar_logging, get_logger, campos, amostrado
+
+configurar_logging()
+log = get_logger("main")
+
 from helpers import (
     send_whatsapp_message,
     criar_assinatura_asaas,
@@ -26,20 +35,174 @@ from helpers import (
     formatar_data,
     notion_search_by_email,
     upsert_student,
+    http_client,
+    fechar_http_client,
+    aquecer_conexoes,
+    _get_data_source_id,
+    notion_property_ids,
+    ContratoNotion,
+    PaginaNome,
+    ALUNO_PROPS,
+    CONTRATO_PROPS,
 )
-
-app = FastAPI()
+from fastjson import dumps, loads, DefaultResponse
+import tracing
+from tracing import trace, span, recent_traces, render_waterfall
+from concurrency import Admissao, AdmissaoRecusada, FalhaGravacao, KeyedSerializer, WriteBehind, digital
+from contratos import TabelaCotacoes, calcular_fim_contrato, calendario_atual, dias_semana
+from flexge_history import get_historico, parse_semana, semana_de_data, semana_iso
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Aquece no boot: a primeira requisição após scale-up já encontra
+    # data sources resolvidos e conexões abertas com os vendors.
+    try:
+        await asyncio.wait_for(warmup_app(), timeout=WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.warning("⚠️ Warmup não terminou em %ss — seguindo sem ele", WARMUP_TIMEOUT)
+    except Exception:
+        # Warmup nunca impede o boot: a instância sobe como "não pronta" e /warmup tenta de novo
+        _warmup_estado["pronto"] = False
+        log.exception("⚠️ Warmup falhou — seguindo sem ele")
+    # Tabela de cotações em segundo plano; até ficar pronta, /calculo/simular calcula na hora.
+    # É opcional: nada aqui pode impedir o boot.
+    try:
+        tabela_cotacoes()
+    except Exception:
+        log.exception("⚠️ Tabela de cotações não agendada — /calculo/simular calcula na hora")
+    yield
+    # Grava o que ainda está no buffer de escrita antes de fechar as conexões
+    await escritas_notion.fechar()
+    await fechar_http_client()
+    tracing.shutdown()
+    encerrar_logging()
+
+
+app = FastAPI(default_response_class=DefaultResponse, lifespan=lifespan)
 
 # ───────────────────── NOTA: SCHEDULER AGORA É EXTERNO ─────────────────────
 # APScheduler interno foi removido. Agora usamos Cloud Scheduler (Google Cloud)
 # Para configurar: execute ./setup-cloud-scheduler.sh
 # Cloud Scheduler chama POST /lista-flexge-semanal/ toda segunda às 08:00
 
+# ─────────────────────────── ADMISSÃO / BACKPRESSURE ────────────────
+# Limite de concorrência por rota (ADMISSAO_<ROTA>_LIMITE/_FILA/_ESPERA_S/_RETRY_AFTER).
+# Acima do limite a requisição espera um pouco na fila; se não couber, volta na hora
+# com 429/503 + Retry-After em vez de empilhar chamadas ao Notion/Asaas.
+_admissao_webhook = Admissao.do_ambiente("webhook", limite=8, fila=32)
+_admissao_calculo = Admissao.do_ambiente("calculo", limite=4, fila=16)
+# /calculo/executar varre o database inteiro: duas execuções simultâneas só duplicam PATCHes
+_admissao_executar = Admissao.do_ambiente("executar", limite=1, fila=0, retry_after=60)
+# Cotação não chama vendor, mas um lote de SIMULAR_MAX_COTACOES prende o event loop
+_admissao_simular = Admissao.do_ambiente("simular", limite=4, fila=16)
+
+ROTAS_ADMISSAO: Dict[tuple, Admissao] = {
+    ("POST", "/webhook/zapsign"): _admissao_webhook,
+    ("POST", "/calculo/preencher"): _admissao_calculo,
+    ("POST", "/calculo/criar"): _admissao_calculo,
+    ("POST", "/calculo/executar"): _admissao_executar,
+    # O flush grava o buffer inteiro no Notion: divide vagas com as outras escritas
+    ("POST", "/calculo/flush"): _admissao_calculo,
+    ("GET", "/calculo/simular"): _admissao_simular,
+    ("POST", "/calculo/simular"): _admissao_simular,
+}
+
+
+@app.middleware("http")
+async def controle_de_admissao(request: Request, call_next):
+    admissao = ROTAS_ADMISSAO.get((request.method, request.url.path))
+    if admissao is None:
+        return await call_next(request)
+    try:
+        async with admissao.vaga():
+            return await call_next(request)
+    except AdmissaoRecusada as e:
+        log.warning(
+            "🚦 %s recusada (%s)", e.rota, e.motivo,
+            extra=amostrado("admissao.recusa", rota=e.rota, status=e.status, **admissao.stats()),
+        )
+        return JSONResponse(
+            status_code=e.status,
+            content={"detail": f"Serviço ocupado ({e.motivo}); tente novamente", "rota": e.rota},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
 # ─────────────────────────── HEALTHCHECK ────────────────────────────
 @app.get("/")
 async def health():
     return {"status": "ok"}
 
+# ─────────────────────────── WARMUP / READINESS ─────────────────────
+# Cloud Scheduler pode chamar /warmup periodicamente; o lifespan chama no boot.
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+_warmup_estado: Dict[str, Any] = {"pronto": False, "ultimo": None}
+_warmup_lock = asyncio.Lock()
+
+
+async def warmup_app() -> Dict[str, Any]:
+    """Resolve data sources e abre conexões pooladas com Notion, Asaas e Z-API."""
+    async with _warmup_lock:
+        inicio = time.perf_counter()
+        conexoes, ds_alunos, ds_calculo = await asyncio.gather(
+            aquecer_conexoes(),
+            _get_data_source_id(),
+            _get_first_data_source_id(CALC_DATABASE_ID) if CALC_DATABASE_ID else asyncio.sleep(0),
+        )
+        # Esquemas para a projeção de propriedades (filter_properties)
+        await asyncio.gather(
+            notion_property_ids(ds_alunos, ALUNO_PROPS),
+            notion_property_ids(ds_calculo, CONTRATO_PROPS),
+        )
+        resultado = {
+            "data_sources": {"alunos": ds_alunos, "calculo": ds_calculo},
+            "conexoes": conexoes,
+            "ms": round((time.perf_counter() - inicio) * 1000, 1),
+        }
+        # Pronto quando o database de alunos foi resolvido e o Notion respondeu;
+        # Asaas/Z-API fora do ar não devem tirar a instância de rotação.
+        _warmup_estado["pronto"] = bool(ds_alunos) and conexoes["notion"]["ok"]
+        _warmup_estado["ultimo"] = resultado
+        log.info(
+            "🔥 Warmup em %sms — pronto=%s", resultado["ms"], _warmup_estado["pronto"],
+            extra=campos(warmup=resultado),
+        )
+        return resultado
+
+
+@app.api_route("/warmup", methods=["GET", "POST"])
+async def warmup():
+    resultado = await warmup_app()
+    return {"pronto": _warmup_estado["pronto"], **resultado}
+
+
+@app.get("/ready")
+async def ready():
+    if _warmup_estado["pronto"]:
+        return {"status": "ready"}
+    return JSONResponse(
+        status_code=503,
+        content={"status": "warming", "ultimo_warmup": _warmup_estado["ultimo"]},
+    )
+
+# ─────────────────────────── DEBUG: TRACES ──────────────────────────
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20, name: Union[str, None] = None, formato: str = "json"):
+    """Últimos traces (webhook/cálculo). `formato=texto` devolve a cascata de cada um."""
+    traces = recent_traces(limit=limit, name=name)
+    if formato == "texto":
+        return PlainTextResponse("\n\n".join(render_waterfall(t) for t in traces))
+    return {"total": len(traces), "traces": traces}
+
+@app.get("/debug/admissao")
+async def debug_admissao():
+    """Requisições em voo/na fila por rota e a fila por aluno do webhook."""
+    return {
+        "rotas": {a.rota: a.stats() for a in dict.fromkeys(ROTAS_ADMISSAO.values())},
+        "eventos_por_aluno": eventos_por_aluno.stats(),
+    }
+
 # ───────────────────── SCHEDULER REMOVIDO ─────────────────────
 # APScheduler interno foi substituído por Cloud Scheduler (Google Cloud)
 # O Cloud Scheduler chama POST /lista-flexge-semanal/ automaticamente
@@ -65,63 +228,81 @@ class WhatsAppRequest(BaseModel):
     phone_number: str
 
 # ─────────────────────────── WEBHOOK ────────────────────────────────
+eventos_por_aluno = KeyedSerializer()
+
 @app.get("/webhook/zapsign")
 async def zapsign_webhook_health():
     """Endpoint para o Zapsign verificar se o webhook está funcionando"""
     return {"status": "ok", "message": "Webhook Zapsign está funcionando"}
 
 @app.post("/webhook/zapsign", status_code=204)
-async def zapsign_webhook(payload: WebhookPayload):
+async def zapsign_webhook(payload: WebhookPayload, response: Response):
     if payload.status != "signed":
         return
 
     # ── dados principais ────────────────────────────────────────────
     email = payload.signer_who_signed.email.strip().lower()
-    name = payload.signer_who_signed.name.strip()
-    phone = f"{payload.signer_who_signed.phone_country}{payload.signer_who_signed.phone_number}"
 
-    # respostas → dict minúsculo
-    respostas = {a.variable.lower(): a.value for a in payload.answers}
+    # Só a impressão digital do e-mail: /debug/traces e o arquivo de traces não guardam PII
+    with trace("zapsign_webhook", aluno=digital(email)) as t:
+        if t:
+            response.headers["X-Trace-Id"] = t.trace_id
+        # Eventos do mesmo aluno rodam em fila (evita página/cliente duplicado);
+        # um reenvio idêntico que chega com o original ainda em voo é mesclado.
+        await eventos_por_aluno.run(
+            email,
+            digital(payload.model_dump_json()),
+            lambda: _processar_assinatura(payload, email),
+        )
 
-    # ── NORMALIZA ALIAS DAS VARIÁVEIS ───────────────────────────────
-    alias_regex = {
-        r"data\s+do\s+primeiro\s+pagamento": "data do primeiro pagamento",
-        r"data\s+(?:do\s+)?último\s+pagamento": "data último pagamento",   # ← melhoria
-        r"r\$valor das parcelas": "r$valor da parcela",
-    }
-    for pattern, canonical in alias_regex.items():
-        for key in list(respostas):
-            if re.fullmatch(pattern, key):
-                respostas[canonical] = respostas[key]
-
-    # ── captura plano e duração ─────────────────────────────────────
-    pacote_raw = (
-        next((v for k, v in respostas.items() if "tipo do pacote" in k), "") or
-        next((v for v in respostas.values() if map_plano(v)), "")
-    )
-    duracao_raw = (
-        next((v for k, v in respostas.items() if "tempo de contrato" in k), "") or
-        next((v for v in respostas.values() if map_duracao(v)), "")
-    )
 
-    # ── datas ───────────────────────────────────────────────────────
-    # Pagamento (para Asaas)
-    vencimento_pagamento_raw = respostas.get("data do primeiro pagamento", "")
-    fim_pagamento_raw = respostas.get("data último pagamento", "")
+async def _processar_assinatura(payload: WebhookPayload, email: str) -> None:
+    with span("normalizacao"):
+        name = payload.signer_who_signed.name.strip()
+        phone = f"{payload.signer_who_signed.phone_country}{payload.signer_who_signed.phone_number}"
 
-    # Contrato (para Notion), com fallback para data de pagamento
-    inicio_contrato_raw = respostas.get("data inicio do contrato", vencimento_pagamento_raw)
-    fim_contrato_raw = respostas.get("data do término do contrato", fim_pagamento_raw)
+        # respostas → dict minúsculo
+        respostas = {a.variable.lower(): a.value for a in payload.answers}
 
-    inicio_contrato = formatar_data(inicio_contrato_raw)
-    fim_contrato = formatar_data(fim_contrato_raw)
+        # ── NORMALIZA ALIAS DAS VARIÁVEIS ───────────────────────────────
+        alias_regex = {
+            r"data\s+do\s+primeiro\s+pagamento": "data do primeiro pagamento",
+            r"data\s+(?:do\s+)?último\s+pagamento": "data último pagamento",   # ← melhoria
+            r"r\$valor das parcelas": "r$valor da parcela",
+        }
+        for pattern, canonical in alias_regex.items():
+            for key in list(respostas):
+                if re.fullmatch(pattern, key):
+                    respostas[canonical] = respostas[key]
+
+        # ── captura plano e duração ─────────────────────────────────────
+        pacote_raw = (
+            next((v for k, v in respostas.items() if "tipo do pacote" in k), "") or
+            next((v for v in respostas.values() if map_plano(v)), "")
+        )
+        duracao_raw = (
+            next((v for k, v in respostas.items() if "tempo de contrato" in k), "") or
+            next((v for v in respostas.values() if map_duracao(v)), "")
+        )
+
+        # ── datas ───────────────────────────────────────────────────────
+        # Pagamento (para Asaas)
+        vencimento_pagamento_raw = respostas.get("data do primeiro pagamento", "")
+        fim_pagamento_raw = respostas.get("data último pagamento", "")
+
+        # Contrato (para Notion), com fallback para data de pagamento
+        inicio_contrato_raw = respostas.get("data inicio do contrato", vencimento_pagamento_raw)
+        fim_contrato_raw = respostas.get("data do término do contrato", fim_pagamento_raw)
+
+        inicio_contrato = formatar_data(inicio_contrato_raw)
+        fim_contrato = formatar_data(fim_contrato_raw)
 
-    if not inicio_contrato:
-        print(f"❌ Início de contrato (Notion) faltando ou inválido: '{inicio_contrato_raw}'")
-    if not fim_contrato:
-        print(f"❌ Fim de contrato (Notion) faltando ou inválido: '{fim_contrato_raw}'")
+        if not inicio_contrato:
+            log.error("❌ Início de contrato (Notion) faltando ou inválido: '%s'", inicio_contrato_raw)
+        if not fim_contrato:
+            log.error("❌ Fim de contrato (Notion) faltando ou inválido: '%s'", fim_contrato_raw)
 
-    nascimento_raw = respostas.get("data de nascimento", "")
+        nascimento_raw = respostas.get("data de nascimento", "")
 
     # ── aluno já existe? ────────────────────────────────────────────
     is_novo = not (await notion_search_by_email(email))
@@ -164,7 +345,7 @@ async def zapsign_webhook(payload: WebhookPayload):
 # ───────────────────── CONFIGURAÇÃO FLEXGE ─────────────────────
 # Configuração da API Flexge
 api_key_flexge = os.getenv('FLEXGE_API_KEY')
-url_flexge = 'https://partner-api.flexge.com/external/students'
+url_flexge = os.getenv('FLEXGE_URL', 'https://partner-api.flexge.com/external/students')
 
 # Headers Flexge
 headers_flexge = {
@@ -202,10 +383,13 @@ def obter_dados_alunos():
     page = 1
     start_date, end_date = get_last_week_dates()
     total_students_data = []
+    todos_alunos = []  # (id, nome, segundos) de todo mundo, para o histórico local
+    completo = False  # só uma varredura até a última página vai para o histórico
 
-    print(f"🔍 Buscando alunos de {start_date.strftime('%Y-%m-%d %H:%M:%S')} até {end_date.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"🔑 API Key Flexge: {'✅ Configurada' if api_key_flexge else '❌ Não configurada'}")
-    print(f"🌐 URL Flexge: {url_flexge}")
+    log.info(
+        "🔍 Buscando alunos de %s até %s", start_date, end_date,
+        extra=campos(flexge_url=url_flexge, api_key_configurada=bool(api_key_flexge)),
+    )
 
     while True:
         params = {
@@ -215,87 +399,106 @@ def obter_dados_alunos():
             'studiedTimeRange[to]': end_date.strftime('%Y-%m-%dT%H:%M:%SZ'),
         }
         
-        print(f"📄 Página {page} - Parâmetros: {params}")
         response = requests.get(url_flexge, headers=headers_flexge, params=params)
-        print(f"📡 Status da resposta: {response.status_code}")
-        
+        log.debug("📄 Página %s - status %s", page, response.status_code, extra=campos(params=params))
+
         if response.status_code == 200:
-            data = response.json()
+            data = loads(response.content)
             students = data.get('docs', [])
             total_docs = data.get('totalDocs', 0)
             
-            print(f"📊 Total de docs na resposta: {total_docs}")
-            print(f"👥 Alunos nesta página: {len(students)}")
-            
+            log.info("👥 Página %s: %s alunos (totalDocs %s)", page, len(students), total_docs)
+
             if students:
                 for aluno in students:
                     nome = aluno.get('name')
                     total_time_seconds = calcular_tempo_total(aluno)
-                    print(f"👤 {nome}: {format_time(total_time_seconds)} ({total_time_seconds}s)")
-                    
-                    if total_time_seconds >= 3600:
+                    todos_alunos.append((aluno.get('id') or aluno.get('_id'), nome, total_time_seconds))
+                    adicionado = total_time_seconds >= 3600
+                    if adicionado:
                         total_students_data.append((nome, total_time_seconds))
-                        print(f"✅ Adicionado: {nome} - {format_time(total_time_seconds)}")
-                    else:
-                        print(f"⏰ Tempo insuficiente: {nome} - {format_time(total_time_seconds)}")
+                    # Uma linha por aluno: amostrada (LOG_SAMPLE_RATE) para não inundar o log
+                    log.info(
+                        "👤 %s: %ss — %s", nome, total_time_seconds,
+                        "✅ adicionado" if adicionado else "⏰ tempo insuficiente",
+                        extra=amostrado("flexge.aluno"),
+                    )
                 page += 1
             else:
-                print("📭 Nenhum aluno nesta página - parando busca")
+                log.info("📭 Nenhum aluno nesta página - parando busca")
+                completo = True
                 break
         else:
-            print(f"❌ Erro na API Flexge: {response.status_code}")
-            print(f"📝 Resposta: {response.text}")
+            log.error(
+                "❌ Erro na API Flexge: %s", response.status_code, extra=campos(resposta=response.text)
+            )
             break
     
-    print(f"🎯 Total de alunos encontrados com +1h: {len(total_students_data)}")
+    log.info("🎯 Total de alunos encontrados com +1h: %s", len(total_students_data))
+    if completo:
+        registrar_historico(start_date, todos_alunos)
+    else:
+        # Semana parcial deixaria alunos de fora e distorceria ranking e sequências
+        log.warning("⚠️ Busca Flexge incompleta (parou na página %s) — histórico da semana não gravado", page)
     return total_students_data
 
-def check_student_exists(notion_data, name):
-    """Verifica se o aluno já está no Notion"""
-    for result in notion_data:
-        try:
-            # Tenta acessar a propriedade Nome (pode ter nome diferente em databases diferentes)
-            props = result.get("properties", {})
-            nome_prop = props.get("Nome") or props.get("Student Name") or props.get("Name")
-            if nome_prop and nome_prop.get("title"):
-                current_name = nome_prop["title"][0]["text"]["content"]
-                if current_name == name:
-                    return result["id"]
-        except (KeyError, IndexError, TypeError):
-            continue
-    return None
-
-def atualizar_ou_criar_notion(alunos):
+def registrar_historico(start_date, alunos):
+    """Persiste a semana coletada no histórico local (falha aqui não derruba a rotina)"""
+    if not alunos:
+        return
+    try:
+        historico = get_historico()
+        n = historico.registrar_semana(semana_de_data(start_date), alunos)
+        historico.salvar()
+        log.info("🗄️ Histórico Flexge: %s alunos gravados em %s", n, semana_iso(semana_de_data(start_date)))
+    except Exception as e:
+        log.warning("⚠️ Não foi possível gravar o histórico Flexge: %s", e)
+
+async def atualizar_ou_criar_notion(alunos):
     """Atualiza ou cria registros no Notion"""
-    from helpers import settings, _headers_notion
-    
-    notion_search_url = f"https://api.notion.com/v1/databases/{settings.NOTION_DB_ID}/query"
-    notion_url = 'https://api.notion.com/v1/pages'
-    
-    response = requests.post(notion_search_url, headers=_headers_notion())
-    notion_data = response.json().get("results", [])
-
-    for nome, tempo in alunos:
-        page_id = check_student_exists(notion_data, nome)
-        formatted_time = format_time(tempo)
-
-        if page_id:
-            update_url = f"https://api.notion.com/v1/pages/{page_id}"
-            data = {
-                "properties": {
-                    "Horas de Estudo": {"rich_text": [{"text": {"content": formatted_time}}]}
+    from helpers import settings, _headers_notion, _get_data_source_id, notion_query_iter, NOME_PROPS
+
+    notion_url = f'{settings.NOTION_BASE}/pages'
+
+    # Percorre o database inteiro (todas as páginas do cursor) só até achar todos os nomes
+    pendentes = {nome for nome, _ in alunos}
+    page_ids = {}
+    # aclosing: o break fecha o gerador na hora e cancela o lote que já estava sendo buscado
+    async with aclosing(notion_query_iter(
+        data_source_id=await _get_data_source_id(),
+        database_id=settings.NOTION_DB_ID,
+        projecao=NOME_PROPS,
+    )) as resultados:
+        async for result in resultados:
+            pagina = PaginaNome.from_page(result)
+            if pagina.nome in pendentes:
+                page_ids[pagina.nome] = pagina.id
+                pendentes.discard(pagina.nome)
+                if not pendentes:
+                    break
+
+    async with http_client(timeout=15) as client:
+        for nome, tempo in alunos:
+            page_id = page_ids.get(nome)
+            formatted_time = format_time(tempo)
+
+            if page_id:
+                update_url = f"{settings.NOTION_BASE}/pages/{page_id}"
+                data = {
+                    "properties": {
+                        "Horas de Estudo": {"rich_text": [{"text": {"content": formatted_time}}]}
+                    }
                 }
-            }
-            response = requests.patch(update_url, headers=_headers_notion(), json=data)
-        else:
-            data = {
-                "parent": {"database_id": settings.NOTION_DB_ID},
-                "properties": {
-                    "Nome": {"title": [{"text": {"content": nome}}]},
-                    "Horas de Estudo": {"rich_text": [{"text": {"content": formatted_time}}]},
+                await client.patch(update_url, headers=_headers_notion(), content=dumps(data))
+            else:
+                data = {
+                    "parent": {"database_id": settings.NOTION_DB_ID},
+                    "properties": {
+                        "Nome": {"title": [{"text": {"content": nome}}]},
+                        "Horas de Estudo": {"rich_text": [{"text": {"content": formatted_time}}]},
+                    }
                 }
-            }
-            response = requests.post(notion_url, headers=_headers_notion(), json=data)
+                await client.post(notion_url, headers=_headers_notion(), content=dumps(data))
 
 def enviar_mensagem_whatsapp(alunos, start_date, end_date, phone_number):
     """Envia a mensagem no WhatsApp com a lista de alunos"""
@@ -321,10 +524,10 @@ def enviar_mensagem_whatsapp(alunos, start_date, end_date, phone_number):
         "Content-Type": "application/json",
         "Client-Token": settings.ZAPI_SECURITY_TOKEN
     }
-    zapi_url = f"https://api.z-api.io/instances/{settings.ZAPI_INSTANCE_ID}/token/{settings.ZAPI_TOKEN}/send-text"
-    response = requests.post(zapi_url, headers=headers_zapi, json=payload)
+    zapi_url = f"{settings.ZAPI_BASE}/instances/{settings.ZAPI_INSTANCE_ID}/token/{settings.ZAPI_TOKEN}/send-text"
+    response = requests.post(zapi_url, headers=headers_zapi, data=dumps(payload))
     if response.status_code == 200:
-        return {"status": "Mensagem enviada com sucesso via WhatsApp!", "response": response.json()}
+        return {"status": "Mensagem enviada com sucesso via WhatsApp!", "response": loads(response.content)}
     else:
         return {"status": "Erro ao enviar mensagem", "details": response.text}
 
@@ -373,20 +576,78 @@ def _montar_props_notion(props: Dict[str, NotionProp]) -> Dict[str, Any]:
     return saida
 
 
+async def _patch_pagina(page_id: str, properties: Dict[str, Any]) -> httpx.Response:
+    from helpers import settings, _headers_notion  # lazy import para reutilizar versão/token
+
+    with span("notion.update", page_id=page_id):
+        async with http_client(timeout=15) as client:
+            r = await client.patch(
+                f"{settings.NOTION_BASE}/pages/{page_id}",
+                headers=_headers_notion(),
+                content=dumps({"properties": properties}),
+            )
+    if r.status_code != 200:
+        log.error("Erro ao atualizar Notion: %s", r.text, extra=campos(status=r.status_code, page_id=page_id))
+    return r
+
+
+async def _gravar_pagina(page_id: str, properties: Dict[str, Any]) -> httpx.Response:
+    """PATCH do write-behind: qualquer não-2xx é falha; 429/5xx/rede voltam ao buffer."""
+    try:
+        r = await _patch_pagina(page_id, properties)
+    except httpx.HTTPError as e:
+        raise FalhaGravacao(f"{type(e).__name__}: {e}", retentavel=True)
+    if r.is_success:
+        return r
+    try:
+        retry_after = float(r.headers.get("Retry-After", ""))
+    except ValueError:
+        retry_after = None
+    raise FalhaGravacao(
+        f"Notion {r.status_code}: {r.text[:300]}",
+        retentavel=r.status_code == 429 or r.status_code >= 500,
+        retry_after=retry_after,
+    )
+
+
+# Write-behind: atualizações da mesma página dentro da janela viram um único PATCH.
+# NOTION_WRITE_BEHIND_MS=0 (padrão) desliga — cada chamada faz o PATCH na hora.
+# NOTION_WRITE_BEHIND_CONCORRENCIA limita os PATCHes simultâneos do buffer (padrão 2),
+# deixando o resto do pool HTTP para as queries e abaixo do rate limit do Notion.
+NOTION_WRITE_BEHIND_MS = float(os.getenv("NOTION_WRITE_BEHIND_MS", "0"))
+NOTION_WRITE_BEHIND_CONCORRENCIA = int(os.getenv("NOTION_WRITE_BEHIND_CONCORRENCIA", "2"))
+escritas_notion = WriteBehind(
+    NOTION_WRITE_BEHIND_MS / 1000, _gravar_pagina, max_concorrencia=NOTION_WRITE_BEHIND_CONCORRENCIA
+)
+
+
 @app.post("/calculo/preencher")
 async def preencher_propriedades(req: PreencherRequest):
-    from helpers import _headers_notion  # lazy import para reutilizar versão/token
-
-    body = {"properties": _montar_props_notion(req.properties)}
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.patch(
-            f"https://api.notion.com/v1/pages/{req.page_id}",
-            headers=_headers_notion(),
-            json=body,
+    props = _montar_props_notion(req.properties)
+    if escritas_notion.ativo:
+        escritas_notion.agendar(req.page_id, props)
+        return JSONResponse(
+            status_code=202,
+            content={"status": "agendado", "page_id": req.page_id, "janela_ms": NOTION_WRITE_BEHIND_MS},
         )
-        if r.status_code == 200:
-            return {"status": "ok", "page_id": req.page_id}
-        raise HTTPException(status_code=r.status_code, detail=r.text)
+
+    r = await _patch_pagina(req.page_id, props)
+    if r.status_code == 200:
+        return {"status": "ok", "page_id": req.page_id}
+    raise HTTPException(status_code=r.status_code, detail=r.text)
+
+
+@app.post("/calculo/flush")
+async def flush_escritas(page_id: Union[str, None] = None):
+    """Grava já o que está no buffer de escrita (uma página ou todas)."""
+    resultados = await escritas_notion.flush(page_id)
+    paginas = {}
+    for pid, r in resultados.items():
+        if isinstance(r, httpx.Response):
+            paginas[pid] = {"status": r.status_code}
+        elif r is not None:
+            paginas[pid] = {"status": None, "erro": str(r), "reagendada": getattr(r, "retentavel", False)}
+    return {"gravadas": len(paginas), "paginas": paginas, "buffer": escritas_notion.stats()}
 
 
 class CriarRequest(BaseModel):
@@ -397,7 +658,7 @@ class CriarRequest(BaseModel):
 
 @app.post("/calculo/criar")
 async def criar_pagina(req: CriarRequest):
-    from helpers import _headers_notion  # reutiliza cabeçalhos/versão
+    from helpers import settings, _headers_notion  # reutiliza cabeçalhos/versão
 
     if not req.parent_data_source_id and not req.parent_database_id:
         raise HTTPException(status_code=400, detail="Informe parent_data_source_id ou parent_database_id")
@@ -413,14 +674,14 @@ async def criar_pagina(req: CriarRequest):
         "properties": _montar_props_notion(req.properties),
     }
 
-    async with httpx.AsyncClient(timeout=15) as client:
+    async with http_client(timeout=15) as client:
         r = await client.post(
-            "https://api.notion.com/v1/pages",
+            f"{settings.NOTION_BASE}/pages",
             headers=_headers_notion(),
-            json=body,
+            content=dumps(body),
         )
         if r.status_code == 200:
-            data = r.json()
+            data = loads(r.content)
             return {"status": "ok", "page_id": data.get("id")}
         raise HTTPException(status_code=r.status_code, detail=r.text)
 
@@ -430,77 +691,60 @@ async def criar_pagina(req: CriarRequest):
 # Database de cálculo de contratos (separado):
 CALC_DATABASE_ID = os.getenv("CALC_DATABASE_ID")
 
-# Pausas (férias) e feriados
-pausas = [
-    ("2025-07-14", "2025-07-31", "Férias Meio do Ano"),
-    ("2025-12-17", "2026-01-09", "Férias Fim de Ano"),
-    ("2026-02-16", "2026-02-20", "Carnaval 2026"),
-    ("2026-07-15", "2026-07-31", "Férias Meio do Ano"),
-    ("2026-12-16", "2027-01-08", "Férias Fim de Ano"),
-    ("2027-07-15", "2027-07-31", "Férias Meio do Ano"),
-    ("2027-12-15", "2028-01-07", "Férias Fim de Ano"),
-    ("2027-02-08", "2027-02-12", "Carnaval 2027"),
-]
-
-feriados = [
-    ("2025-04-21", "Feriado Tiradentes"),
-    ("2025-05-01", "Feriado Dia do Trabalho"),
-    ("2025-06-19", "Feriado Corpus Christi"),
-    ("2025-11-20", "Feriado Consciência Negra"),
-    ("2026-04-21", "Feriado Tiradentes"),
-    ("2026-05-01", "Feriado Dia do Trabalho"),
-    ("2026-06-19", "Feriado Corpus Christi"),
-    ("2026-09-07", "Feriado Dia da Independência"),
-    ("2026-10-12", "Feriado Nossa Senhora Aparecida"),
-    ("2026-11-02", "Feriado Dia de Finados"),
-    ("2026-11-20", "Feriado Consciência Negra"),
-    ("2027-04-21", "Feriado Tiradentes"),
-    ("2027-09-07", "Feriado Dia da Independência"),
-    ("2027-10-12", "Feriado Nossa Senhora Aparecida"),
-    ("2027-11-02", "Feriado Dia de Finados"),
-    ("2027-11-15", "Feriado Proclamação da República"),
-]
+# Pausas, feriados e calcular_fim_contrato ficam em contratos.py (módulo puro,
+# também usado pelo recálculo em lote).
 
 
-async def _get_first_data_source_id(db_id: str) -> str | None:
-    from helpers import _headers_notion
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(
-            f"https://api.notion.com/v1/databases/{db_id}",
-            headers=_headers_notion(),
-        )
-        if r.status_code != 200:
-            return None
-        return (r.json() or {}).get("data_sources", [{}])[0].get("id")
+_DATA_SOURCE_IDS: Dict[str, str] = {}
 
 
-async def _query_database(db_id: str, payload: Dict[str, Any]) -> List[dict]:
-    from helpers import _headers_notion
+async def _get_first_data_source_id(db_id: str) -> str | None:
+    from helpers import settings, _headers_notion
+    if db_id in _DATA_SOURCE_IDS:
+        return _DATA_SOURCE_IDS[db_id]
+    with span("notion.data_source"):
+        async with http_client(timeout=10) as client:
+            try:
+                r = await client.get(
+                    f"{settings.NOTION_BASE}/databases/{db_id}",
+                    headers=_headers_notion(),
+                )
+            except httpx.HTTPError as e:
+                log.warning("⚠️ Não foi possível resolver o data source de %s: %s", db_id, e)
+                return None
+            if r.status_code != 200:
+                return None
+            ds_id = (loads(r.content) or {}).get("data_sources", [{}])[0].get("id")
+            if ds_id:
+                _DATA_SOURCE_IDS[db_id] = ds_id
+            return ds_id
+
+
+async def _iter_database(
+    db_id: str,
+    payload: Dict[str, Any],
+    page_size: int = 100,
+    projecao: Union[Sequence[str], None] = None,
+) -> AsyncIterator[dict]:
+    from helpers import notion_query_iter
     ds_id = await _get_first_data_source_id(db_id)
-    async with httpx.AsyncClient(timeout=15) as client:
-        if ds_id:
-            r = await client.post(
-                f"https://api.notion.com/v1/data_sources/{ds_id}/query",
-                headers=_headers_notion(),
-                json=payload,
-            )
-        else:
-            r = await client.post(
-                f"https://api.notion.com/v1/databases/{db_id}/query",
-                headers=_headers_notion(),
-                json=payload,
-            )
-        if r.status_code != 200:
-            print("Erro ao buscar contratos:", r.text)
-            return []
-        return r.json().get("results", [])
-
-
-async def buscar_contratos_pendentes() -> List[dict]:
+    try:
+        # Se quem consome parar antes do fim, o aclose deste gerador fecha o de baixo junto
+        async with aclosing(notion_query_iter(
+            payload, data_source_id=ds_id, database_id=db_id, page_size=page_size, projecao=projecao
+        )) as paginas:
+            async for pagina in paginas:
+                yield pagina
+    except httpx.HTTPStatusError as e:
+        log.error("Erro ao buscar contratos: %s", e.response.text, extra=campos(status=e.response.status_code))
+
+
+async def iterar_contratos_pendentes() -> AsyncIterator[ContratoNotion]:
     if not CALC_DATABASE_ID:
-        print("⚠️ CALC_DATABASE_ID não definido no ambiente")
-        return []
-    return await _query_database(CALC_DATABASE_ID, payload={})
+        log.warning("⚠️ CALC_DATABASE_ID não definido no ambiente")
+        return
+    async for pagina in _iter_database(CALC_DATABASE_ID, payload={}, projecao=CONTRATO_PROPS):
+        yield ContratoNotion.from_page(pagina)
 
 
 def chunk_text_rich_text(long_text: str, chunk_size: int = 2000) -> List[Dict[str, Any]]:
@@ -508,85 +752,160 @@ def chunk_text_rich_text(long_text: str, chunk_size: int = 2000) -> List[Dict[st
     return [{"text": {"content": chunk}} for chunk in chunks]
 
 
-def calcular_fim_contrato(data_inicio_str: str, duracao_meses: int, dia_aula_str: str):
-    data_inicio = datetime.strptime(data_inicio_str, "%Y-%m-%d")
-    data_fim_base = data_inicio + timedelta(days=30 * duracao_meses)
-    dias_a_mais = 7
+async def atualizar_notion(page_id: str, data_fim: str, dias_a_mais: int, pausas_consideradas: List[str], feriados_considerados: List[str]):
+    pausas_str = ", ".join(pausas_consideradas)
+    feriados_str = ", ".join(feriados_considerados)
+    pausas_rich = chunk_text_rich_text(pausas_str)
+    feriados_rich = chunk_text_rich_text(feriados_str)
 
-    pausas_consideradas: List[str] = []
-    feriados_considerados: List[str] = []
+    props = {
+        "Data de Fim do Contrato": {"date": {"start": data_fim}},
+        "Dias a mais": {"number": dias_a_mais},
+        "Pausas Consideradas": {"rich_text": pausas_rich},
+        "Feriados Considerados": {"rich_text": feriados_rich},
+        "Calcular data": {"select": {"name": "Finalizado"}},
+    }
+    if escritas_notion.ativo:
+        escritas_notion.agendar(page_id, props)
+    else:
+        await _patch_pagina(page_id, props)
 
-    dias_semana = {"Segunda": 0, "Terça": 1, "Quarta": 2, "Quinta": 3, "Sexta": 4}
-    dia_aula_num = dias_semana.get(dia_aula_str, -1)
 
-    for ini_str, fim_str, desc in pausas:
-        ini_dt = datetime.strptime(ini_str, "%Y-%m-%d")
-        fim_dt = datetime.strptime(fim_str, "%Y-%m-%d")
-        overlap_ini = max(data_inicio, ini_dt)
-        overlap_fim = min(data_fim_base, fim_dt)
-        if overlap_ini <= overlap_fim:
-            delta = (overlap_fim - overlap_ini).days + 1
-            dias_a_mais += delta
-            legenda = f"{ini_dt.strftime('%d/%m/%Y')} a {fim_dt.strftime('%d/%m/%Y')} ({desc})"
-            pausas_consideradas.append(legenda)
+@app.post("/calculo/executar")
+async def executar_calculo(response: Response):
+    with trace("calculo_executar") as t:
+        if t:
+            response.headers["X-Trace-Id"] = t.trace_id
+        # Processa cada lote enquanto o próximo já está sendo buscado no Notion
+        async for contrato in iterar_contratos_pendentes():
+            page_id = contrato.id
+            try:
+                if not (contrato.data_inicio and contrato.duracao_meses is not None and contrato.dia_aula):
+                    raise ValueError("propriedades de início/duração/dia da aula incompletas")
+                with span("calculo", page_id=page_id):
+                    data_fim, dias_a_mais, pausas_consideradas, feriados_considerados = calcular_fim_contrato(
+                        contrato.data_inicio, contrato.duracao_meses, contrato.dia_aula
+                    )
+                await atualizar_notion(page_id, data_fim, dias_a_mais, pausas_consideradas, feriados_considerados)
+            except Exception as e:
+                log.error("Erro ao processar contrato %s: %s", page_id, e)
+    if escritas_notion.ativo:
+        # As gravações ainda estão no buffer; falhas aparecem em /calculo/flush
+        return {
+            "status": "agendado",
+            "message": "Contratos calculados; gravação no Notion agendada",
+            "buffer": escritas_notion.stats(),
+        }
+    return {"status": "ok", "message": "Contratos processados com sucesso"}
 
-    for feriado_str, feriado_desc in feriados:
-        feriado_dt = datetime.strptime(feriado_str, "%Y-%m-%d")
-        if data_inicio <= feriado_dt <= data_fim_base:
-            if feriado_dt.weekday() == dia_aula_num:
-                dias_a_mais += 1
-                feriados_considerados.append(f"{feriado_dt.strftime('%d/%m/%Y')} ({feriado_desc})")
+# ───────────────────── SIMULAÇÃO (COTAÇÃO) DE FIM DE CONTRATO ─────────────────────
+# Tabela pré-calculada: datas de início de hoje-SIMULAR_DIAS_ANTES a hoje+SIMULAR_DIAS_DEPOIS
+# × durações de 1 a SIMULAR_DURACAO_MAX meses × dia da aula. É reconstruída quando o
+# calendário (contratos.py / CALENDARIO_FILE) ou o dia mudam. Não chama o Notion.
+SIMULAR_DIAS_ANTES = int(os.getenv("SIMULAR_DIAS_ANTES", "30"))
+SIMULAR_DIAS_DEPOIS = int(os.getenv("SIMULAR_DIAS_DEPOIS", "365"))
+SIMULAR_DURACAO_MAX = int(os.getenv("SIMULAR_DURACAO_MAX", "24"))
+SIMULAR_MAX_COTACOES = int(os.getenv("SIMULAR_MAX_COTACOES", "5000"))
+SIMULAR_DURACAO_LIMITE = 120  # meses; acima disso a data estoura o datetime e não é contrato real
 
-    data_fim = data_fim_base + timedelta(days=dias_a_mais)
-    pausas_consideradas.sort()
-    feriados_considerados.sort()
-    return data_fim.strftime("%Y-%m-%d"), dias_a_mais, pausas_consideradas, feriados_considerados
+_tabela: Dict[str, Any] = {"atual": None, "construindo": None}
 
 
-async def atualizar_notion(page_id: str, data_fim: str, dias_a_mais: int, pausas_consideradas: List[str], feriados_considerados: List[str]):
-    from helpers import _headers_notion
-    pausas_str = ", ".join(pausas_consideradas)
-    feriados_str = ", ".join(feriados_considerados)
-    pausas_rich = chunk_text_rich_text(pausas_str)
-    feriados_rich = chunk_text_rich_text(feriados_str)
+async def _construir_tabela(calendario, hoje) -> None:
+    try:
+        tabela = await asyncio.to_thread(
+            TabelaCotacoes, calendario, hoje, SIMULAR_DIAS_ANTES, SIMULAR_DIAS_DEPOIS,
+            range(1, SIMULAR_DURACAO_MAX + 1),
+        )
+        _tabela["atual"] = tabela
+        log.info("📅 Tabela de cotações pronta", extra=campos(tabela=tabela.stats()))
+    except Exception as e:
+        log.error("Erro ao construir tabela de cotações: %s", e)
+    finally:
+        _tabela["construindo"] = None
+
+
+def tabela_cotacoes() -> Union[TabelaCotacoes, None]:
+    """A tabela válida para hoje/calendário atual; se estiver velha, agenda a reconstrução."""
+    calendario = calendario_atual()
+    hoje = datetime.now(timezone.utc).date()
+    tabela = _tabela["atual"]
+    if tabela is not None and tabela.valida(calendario, hoje):
+        return tabela
+    if _tabela["construindo"] is None:
+        _tabela["construindo"] = asyncio.create_task(_construir_tabela(calendario, hoje))
+    return None
 
-    body = {
-        "properties": {
-            "Data de Fim do Contrato": {"date": {"start": data_fim}},
-            "Dias a mais": {"number": dias_a_mais},
-            "Pausas Consideradas": {"rich_text": pausas_rich},
-            "Feriados Considerados": {"rich_text": feriados_rich},
-            "Calcular data": {"select": {"name": "Finalizado"}},
-        }
+
+class Cotacao(BaseModel):
+    data_inicio: str
+    duracao_meses: int
+    dia_aula: str
+
+
+class SimularRequest(BaseModel):
+    cotacoes: List[Cotacao]
+
+
+def _cotar(tabela: Union[TabelaCotacoes, None], c: Cotacao) -> Dict[str, Any]:
+    if not 1 <= c.duracao_meses <= SIMULAR_DURACAO_LIMITE:
+        raise ValueError(f"duracao_meses deve estar entre 1 e {SIMULAR_DURACAO_LIMITE}")
+    if c.dia_aula not in dias_semana:
+        # Sem isso um dia desconhecido passa calado e nenhum feriado é considerado
+        raise ValueError(f"dia_aula deve ser um de: {', '.join(dias_semana)}")
+    data_inicio = datetime.strptime(c.data_inicio, "%Y-%m-%d").date()
+    resultado = tabela.buscar(data_inicio, c.duracao_meses, c.dia_aula) if tabela else None
+    origem = "tabela"
+    if resultado is None:
+        resultado = calcular_fim_contrato(c.data_inicio, c.duracao_meses, c.dia_aula)
+        origem = "calculado"
+    data_fim, dias_a_mais, pausas_consideradas, feriados_considerados = resultado
+    return {
+        "data_inicio": c.data_inicio,
+        "duracao_meses": c.duracao_meses,
+        "dia_aula": c.dia_aula,
+        "data_fim": data_fim,
+        "dias_a_mais": dias_a_mais,
+        "pausas_consideradas": pausas_consideradas,
+        "feriados_considerados": feriados_considerados,
+        "origem": origem,
     }
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.patch(
-            f"https://api.notion.com/v1/pages/{page_id}",
-            headers=_headers_notion(),
-            json=body,
-        )
-        if r.status_code != 200:
-            print("Erro ao atualizar Notion:", r.text)
 
 
-@app.post("/calculo/executar")
-async def executar_calculo():
-    contratos = await buscar_contratos_pendentes()
-    for contrato in contratos:
-        page_id = contrato.get("id")
-        prop = contrato.get("properties", {})
+@app.get("/calculo/simular")
+async def simular_contrato(
+    data_inicio: str,
+    duracao_meses: int = Query(ge=1, le=SIMULAR_DURACAO_LIMITE),
+    dia_aula: str = Query(),
+):
+    """Data de fim para um contrato ainda não criado (data_inicio YYYY-MM-DD, dia_aula Segunda…Sexta)."""
+    try:
+        return _cotar(tabela_cotacoes(), Cotacao(data_inicio=data_inicio, duracao_meses=duracao_meses, dia_aula=dia_aula))
+    except (ValueError, OverflowError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/calculo/simular")
+async def simular_contratos(req: SimularRequest):
+    """Várias cotações de uma vez; uma cotação inválida vira `erro` sem derrubar as outras."""
+    if len(req.cotacoes) > SIMULAR_MAX_COTACOES:
+        raise HTTPException(status_code=413, detail=f"Máximo de {SIMULAR_MAX_COTACOES} cotações por chamada")
+    tabela = tabela_cotacoes()
+    saida = []
+    for c in req.cotacoes:
         try:
-            data_inicio = prop["Data de Início"]["date"]["start"]
-            duracao_meses = int(prop["Duração em meses"]["number"])  # type: ignore[arg-type]
-            dia_aula = prop["Dia da Semana das aulas"]["select"]["name"]
+            saida.append(_cotar(tabela, c))
+        except (ValueError, OverflowError) as e:
+            saida.append({**c.model_dump(), "erro": str(e)})
+    return {"total": len(saida), "cotacoes": saida}
 
-            data_fim, dias_a_mais, pausas_consideradas, feriados_considerados = calcular_fim_contrato(
-                data_inicio, duracao_meses, dia_aula
-            )
-            await atualizar_notion(page_id, data_fim, dias_a_mais, pausas_consideradas, feriados_considerados)
-        except Exception as e:
-            print(f"Erro ao processar contrato {page_id}: {e}")
-    return {"status": "ok", "message": "Contratos processados com sucesso"}
+
+@app.get("/calculo/simular/tabela")
+async def simular_tabela():
+    """Estado da tabela (pronta para hoje/calendário atual ou sendo reconstruída)."""
+    pronta = tabela_cotacoes() is not None
+    atual = _tabela["atual"]
+    return {"pronta": pronta, "tabela": atual.stats() if atual else None}
 
 # ───────────────────── ROTA FLEXGE SEMANAL ─────────────────────
 @app.post("/lista-flexge-semanal/")
@@ -595,7 +914,7 @@ async def lista_flexge_semanal(request: WhatsAppRequest):
     alunos = obter_dados_alunos()
     if alunos:
         # Notion update desabilitado - use database separado se necessário
-        # atualizar_ou_criar_notion(alunos)
+        # await atualizar_ou_criar_notion(alunos)
         result = enviar_mensagem_whatsapp(alunos, start_date, end_date, request.phone_number)
         return {"whatsapp": result, "total_alunos": len(alunos)}
     else:
@@ -614,3 +933,86 @@ async def teste_flexge():
         "api_key_configurada": bool(api_key_flexge),
         "url_flexge": url_flexge
     }
+
+# ───────────────────── HISTÓRICO FLEXGE (LOCAL) ─────────────────────
+def _semana_param(valor: Union[str, None], padrao: Union[int, None]) -> Union[int, None]:
+    if not valor:
+        return padrao
+    try:
+        return parse_semana(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Semana inválida: '{valor}' (use 2025-W07 ou YYYY-MM-DD)")
+
+
+@app.get("/flexge/historico")
+async def flexge_historico_resumo():
+    return get_historico().resumo()
+
+
+@app.get("/flexge/historico/ranking")
+async def flexge_historico_ranking(
+    inicio: Union[str, None] = None,
+    fim: Union[str, None] = None,
+    limite: int = 20,
+    minimo_horas: float = 0,
+):
+    """Ranking de horas estudadas num período arbitrário de semanas (padrão: últimas 4)."""
+    ultima = semana_de_data(get_last_week_dates()[0])
+    fim_s = _semana_param(fim, ultima)
+    inicio_s = _semana_param(inicio, fim_s - 3)
+    ranking = get_historico().ranking(inicio_s, fim_s, limite=limite, minimo=int(minimo_horas * 3600))
+    return {
+        "periodo": f"{semana_iso(inicio_s)} até {semana_iso(fim_s)}",
+        "total_alunos": len(ranking),
+        "alunos": [
+            {"id": id_, "nome": nome, "tempo": format_time(seg), "segundos": seg, "semanas_com_estudo": semanas}
+            for id_, nome, seg, semanas in ranking
+        ],
+    }
+
+
+@app.get("/flexge/historico/aluno")
+async def flexge_historico_aluno(id: Union[str, None] = None, nome: Union[str, None] = None):
+    """Tempo de estudo semana a semana de um aluno (pelo id do Flexge ou, se único, pelo nome)."""
+    historico = get_historico()
+    if not id:
+        if not nome:
+            raise HTTPException(status_code=400, detail="Informe id ou nome")
+        ids = historico.ids_por_nome(nome)
+        if len(ids) > 1:
+            raise HTTPException(status_code=409, detail={"erro": f"Mais de um aluno chamado '{nome}'", "ids": ids})
+        id = ids[0] if ids else ""
+    semanas = historico.tendencia(id)
+    if not semanas:
+        raise HTTPException(status_code=404, detail=f"Aluno sem histórico: '{id or nome}'")
+    return {
+        "id": id,
+        "nome": historico.nome_de(id),
+        "total": format_time(sum(seg for _, seg in semanas)),
+        "semanas": [
+            {"semana": semana_iso(s), "tempo": format_time(seg), "segundos": seg} for s, seg in semanas
+        ],
+    }
+
+
+@app.get("/flexge/historico/sequencias")
+async def flexge_historico_sequencias(
+    semanas: int = 4,
+    minimo_horas: float = 1,
+    atual: bool = True,
+    ate: Union[str, None] = None,
+):
+    """Alunos que estudaram >= `minimo_horas` por `semanas` semanas consecutivas."""
+    ate_s = _semana_param(ate, None)
+    resultado = get_historico().sequencias(
+        semanas, minimo=int(minimo_horas * 3600), atual=atual, ate=ate_s
+    )
+    return {
+        "semanas_minimas": semanas,
+        "minimo_horas": minimo_horas,
+        "total_alunos": len(resultado),
+        "alunos": [
+            {"id": id_, "nome": nome, "semanas_consecutivas": n, "ate": semana_iso(fim)}
+            for id_, nome, n, fim in resultado
+        ],
+    }
@@ -0,0 +1,273 @@
+# ~/Downloads/OnboardingKarol/recalcular_contratos.py
+# Recálculo offline (em lote) da data de fim de contrato.
+#
+# Lê um export CSV ou JSONL do database de cálculo em streaming e calcula cada linha
+# com contratos.calcular_fim_contrato em vários processos. O trabalho vai em lotes,
+# então a memória fica constante. O resultado é gravado à medida que sai, na mesma
+# ordem da entrada. Não chama o Notion.
+#
+# Colunas aceitas na entrada (nomes curtos ou os do Notion):
+#   id | page_id
+#   data_inicio | "Data de Início"                (YYYY-MM-DD)
+#   duracao_meses | "Duração em meses"
+#   dia_aula | "Dia da Semana das aulas"          (Segunda … Sexta)
+#
+# Uso:
+#   python recalcular_contratos.py contratos.csv -o resultado.jsonl
+#   python recalcular_contratos.py contratos.jsonl -o resultado.csv --workers 8 --lote 5000
+#   python recalcular_contratos.py contratos.csv -o mudancas.jsonl --diff resultado_anterior.jsonl
+
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from contratos import calcular_fim_contrato, calendario_atual
+from fastjson import dumps, loads
+
+Entrada = Tuple[str, str, str, str, str]  # (id, data_inicio, duracao_meses, dia_aula, erro de leitura)
+Saida = Tuple[str, str, str, str, str, Optional[int], str, str, str]
+
+COLUNAS = (
+    "id", "data_inicio", "duracao_meses", "dia_aula",
+    "data_fim", "dias_a_mais", "pausas_consideradas", "feriados_considerados", "erro",
+)
+COLUNAS_DIFF = COLUNAS + ("situacao", "data_fim_anterior", "dias_a_mais_anterior")
+
+_ALIASES = {
+    "id": ("id", "page_id"),
+    "data_inicio": ("data_inicio", "Data de Início"),
+    "duracao_meses": ("duracao_meses", "Duração em meses"),
+    "dia_aula": ("dia_aula", "Dia da Semana das aulas"),
+}
+
+
+# ─────────────────────────── ENTRADA ────────────────────────────────
+def _campo(linha: Dict[str, Any], nome: str) -> str:
+    for chave in _ALIASES[nome]:
+        valor = linha.get(chave)
+        if valor not in (None, ""):
+            return str(valor).strip()
+    return ""
+
+
+def _formato(caminho: str, formato: Optional[str]) -> str:
+    if formato:
+        return formato
+    return "csv" if caminho.lower().endswith(".csv") else "jsonl"
+
+
+def _linhas_jsonl(f: TextIO) -> Iterator[Any]:
+    """Um objeto por linha; linha ilegível vira a exceção, para sair como linha com erro."""
+    for l in f:
+        if not l.strip():
+            continue
+        try:
+            linha = loads(l)
+        except ValueError as e:
+            yield ValueError(f"JSON inválido: {e}")
+            continue
+        yield linha if isinstance(linha, dict) else TypeError(f"linha JSONL não é um objeto: {l.strip()[:80]}")
+
+
+def ler_contratos(caminho: str, formato: Optional[str] = None) -> Iterator[Entrada]:
+    """Gera (id, data_inicio, duracao_meses, dia_aula, erro) linha a linha, sem carregar o arquivo."""
+    formato = _formato(caminho, formato)
+    with open(caminho, encoding="utf-8", newline="") as f:
+        if formato == "csv":
+            linhas: Iterable[Any] = csv.DictReader(f)
+        else:
+            linhas = _linhas_jsonl(f)
+        for n, linha in enumerate(linhas, start=1):
+            if isinstance(linha, Exception):
+                yield (f"linha-{n}", "", "", "", str(linha))
+                continue
+            yield (
+                _campo(linha, "id") or f"linha-{n}",
+                _campo(linha, "data_inicio"),
+                _campo(linha, "duracao_meses"),
+                _campo(linha, "dia_aula"),
+                "",
+            )
+
+
+# ─────────────────────────── WORKER ─────────────────────────────────
+def calcular_lote(lote: List[Entrada]) -> List[Saida]:
+    """Roda no processo filho. Erros de uma linha viram a coluna `erro`, não derrubam o lote."""
+    saida: List[Saida] = []
+    calendario = calendario_atual()
+    for id_, data_inicio, duracao, dia_aula, erro in lote:
+        if erro:
+            saida.append((id_, data_inicio, duracao, dia_aula, "", None, "", "", erro))
+            continue
+        try:
+            data_fim, dias_a_mais, pausas, feriados = calcular_fim_contrato(
+                data_inicio, int(float(duracao)), dia_aula, calendario
+            )
+            # Mesmo texto que atualizar_notion grava em "Pausas/Feriados Considerados"
+            saida.append((id_, data_inicio, duracao, dia_aula, data_fim, dias_a_mais,
+                          ", ".join(pausas), ", ".join(feriados), ""))
+        except (ValueError, TypeError, OverflowError) as e:
+            # OverflowError: duração absurda (inf, 1e9) estoura o datetime
+            saida.append((id_, data_inicio, duracao, dia_aula, "", None, "", "", str(e)))
+    return saida
+
+
+def _em_lotes(contratos: Iterable[Entrada], tamanho: int) -> Iterator[List[Entrada]]:
+    it = iter(contratos)
+    while lote := list(islice(it, tamanho)):
+        yield lote
+
+
+def calcular_em_paralelo(contratos: Iterable[Entrada], workers: int, lote: int) -> Iterator[Saida]:
+    """
+    Resultados na ordem da entrada. No máximo 2×workers lotes ficam em voo, então a
+    leitura não corre à frente do cálculo. Com workers=0 tudo roda no processo atual.
+    """
+    if workers <= 0:
+        for pedaco in _em_lotes(contratos, lote):
+            yield from calcular_lote(pedaco)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        em_voo: Deque[Future] = deque()
+        for pedaco in _em_lotes(contratos, lote):
+            em_voo.append(pool.submit(calcular_lote, pedaco))
+            if len(em_voo) >= workers * 2:
+                yield from em_voo.popleft().result()
+        while em_voo:
+            yield from em_voo.popleft().result()
+
+
+# ─────────────────────────── SAÍDA ──────────────────────────────────
+class Escritor:
+    """Grava linhas (dict) em CSV ou JSONL conforme a extensão; '-' é o stdout."""
+
+    def __init__(self, caminho: str, colunas: Tuple[str, ...], formato: Optional[str] = None):
+        self.formato = _formato(caminho, formato)
+        self.colunas = colunas
+        self._arquivo: TextIO = sys.stdout if caminho == "-" else open(caminho, "w", encoding="utf-8", newline="")
+        self._csv = None
+        if self.formato == "csv":
+            self._csv = csv.DictWriter(self._arquivo, fieldnames=colunas, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def escrever(self, linha: Dict[str, Any]) -> None:
+        if self._csv:
+            self._csv.writerow(linha)
+        else:
+            self._arquivo.write(dumps({c: linha.get(c) for c in self.colunas}).decode("utf-8") + "\n")
+
+    def fechar(self) -> None:
+        if self._arquivo is not sys.stdout:
+            self._arquivo.close()
+
+
+# ─────────────────────────── DIFF ───────────────────────────────────
+_PLURAL = {"igual": "iguais", "alterado": "alterados", "novo": "novos"}
+
+
+def carregar_anterior(caminho: str, formato: Optional[str] = None) -> Dict[str, Tuple[str, str]]:
+    """id → (data_fim, dias_a_mais) de uma saída anterior deste script."""
+    formato = _formato(caminho, formato)
+    anterior: Dict[str, Tuple[str, str]] = {}
+    with open(caminho, encoding="utf-8", newline="") as f:
+        linhas: Iterable[Any] = csv.DictReader(f) if formato == "csv" else _linhas_jsonl(f)
+        for linha in linhas:
+            if isinstance(linha, Exception):
+                continue  # linha ilegível: o id dela conta como novo no diff
+            dias = linha.get("dias_a_mais")
+            anterior[str(linha.get("id"))] = (linha.get("data_fim") or "", "" if dias is None else str(dias))
+    return anterior
+
+
+# ─────────────────────────── EXECUÇÃO ───────────────────────────────
+def executar(args: argparse.Namespace) -> Dict[str, Any]:
+    anterior = carregar_anterior(args.diff) if args.diff else None
+    escritor = Escritor(args.saida, COLUNAS_DIFF if anterior is not None else COLUNAS, args.formato_saida)
+    contagem = {"linhas": 0, "erros": 0, "iguais": 0, "alterados": 0, "novos": 0}
+    vistos = set()
+
+    inicio = ultimo_relatorio = time.perf_counter()
+    try:
+        for r in calcular_em_paralelo(ler_contratos(args.entrada, args.formato), args.workers, args.lote):
+            linha = dict(zip(COLUNAS, r))
+            contagem["linhas"] += 1
+            if linha["erro"]:
+                contagem["erros"] += 1
+
+            if anterior is None:
+                escritor.escrever(linha)
+            else:
+                vistos.add(linha["id"])
+                antes = anterior.get(linha["id"])
+                agora = (linha["data_fim"], "" if linha["dias_a_mais"] is None else str(linha["dias_a_mais"]))
+                situacao = "novo" if antes is None else ("igual" if antes == agora else "alterado")
+                contagem[_PLURAL[situacao]] += 1
+                if situacao != "igual":
+                    linha["situacao"] = situacao
+                    linha["data_fim_anterior"], linha["dias_a_mais_anterior"] = antes or (None, None)
+                    escritor.escrever(linha)
+
+            agora_t = time.perf_counter()
+            if agora_t - ultimo_relatorio >= args.intervalo:
+                ultimo_relatorio = agora_t
+                print(f"   … {contagem['linhas']} linhas — "
+                      f"{contagem['linhas'] / (agora_t - inicio):,.0f} linhas/s", file=sys.stderr)
+    finally:
+        escritor.fechar()
+
+    duracao = time.perf_counter() - inicio
+    resumo: Dict[str, Any] = {
+        "linhas": contagem["linhas"],
+        "erros": contagem["erros"],
+        "segundos": round(duracao, 2),
+        "linhas_por_s": round(contagem["linhas"] / duracao, 1) if duracao else None,
+        "workers": args.workers,
+        "lote": args.lote,
+        "calendario": calendario_atual().digital,
+    }
+    if anterior is not None:
+        resumo.update(
+            iguais=contagem["iguais"],
+            alterados=contagem["alterados"],
+            novos=contagem["novos"],
+            ausentes=sum(1 for id_ in anterior if id_ not in vistos),
+        )
+    return resumo
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Recalcula datas de fim de contrato a partir de um export CSV/JSONL")
+    p.add_argument("entrada", help="export CSV ou JSONL dos contratos")
+    p.add_argument("-o", "--saida", default="-", help="arquivo de saída (.csv ou .jsonl; '-' = stdout)")
+    p.add_argument("--formato", choices=("csv", "jsonl"), help="formato da entrada (padrão: pela extensão)")
+    p.add_argument("--formato-saida", choices=("csv", "jsonl"), help="formato da saída (padrão: pela extensão)")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos (0 = sem pool)")
+    p.add_argument("--lote", type=int, default=2000, help="linhas por lote enviado a cada processo")
+    p.add_argument("--diff", metavar="ANTERIOR", help="saída anterior: grava só linhas novas/alteradas")
+    p.add_argument("--intervalo", type=float, default=5.0, help="segundos entre relatórios de progresso")
+    p.add_argument("--json", action="store_true", help="resumo final em JSON")
+    args = p.parse_args()
+
+    resumo = executar(args)
+    if args.json:
+        print(dumps(resumo).decode("utf-8"), file=sys.stderr)
+        return
+    print(f"\n✅ {resumo['linhas']} contratos em {resumo['segundos']}s "
+          f"({resumo['linhas_por_s']} linhas/s, {resumo['workers']} workers, "
+          f"calendário {resumo['calendario']})", file=sys.stderr)
+    if resumo["erros"]:
+        print(f"   ⚠️ {resumo['erros']} linhas com erro (coluna 'erro')", file=sys.stderr)
+    if args.diff:
+        print(f"   diff: {resumo['alterados']} alterados, {resumo['novos']} novos, "
+              f"{resumo['iguais']} iguais, {resumo['ausentes']} ausentes na entrada", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ REGION="southamerica-east1"
 SERVICE_URL="https://onboarding-karol-526882424199.southamerica-east1.run.app"
 SCHEDULER_LOCATION="southamerica-east1"
 JOB_NAME="flexge-lista-semanal"
+WARMUP_JOB_NAME="onboarding-warmup"
 
 # Read WhatsApp number from secret
 WHATSAPP_NUMBER=$(gcloud secrets versions access latest --secret=WHATSAPP_AUTO_NUMBER --project=$PROJECT_ID)
@@ -50,6 +51,28 @@ gcloud scheduler jobs update http $JOB_NAME \
   --attempt-deadline=300s \
   2>/dev/null || true
 
+# Warmup: mantém data sources resolvidos e conexões abertas em horário comercial
+echo "🔥 Criando job de warmup..."
+gcloud scheduler jobs create http $WARMUP_JOB_NAME \
+  --project=$PROJECT_ID \
+  --location=$SCHEDULER_LOCATION \
+  --schedule="*/10 7-21 * * *" \
+  --time-zone="America/Sao_Paulo" \
+  --uri="${SERVICE_URL}/warmup" \
+  --http-method=POST \
+  --description="Aquece a instância (data sources + conexões) a cada 10 min" \
+  --attempt-deadline=30s \
+  || gcloud scheduler jobs update http $WARMUP_JOB_NAME \
+  --project=$PROJECT_ID \
+  --location=$SCHEDULER_LOCATION \
+  --schedule="*/10 7-21 * * *" \
+  --time-zone="America/Sao_Paulo" \
+  --uri="${SERVICE_URL}/warmup" \
+  --http-method=POST \
+  --description="Aquece a instância (data sources + conexões) a cada 10 min" \
+  --attempt-deadline=30s \
+  2>/dev/null || true
+
 echo ""
 echo "✅ Cloud Scheduler configurado com sucesso!"
 echo ""
@@ -58,6 +81,7 @@ echo "   Nome: $JOB_NAME"
 echo "   Horário: Toda segunda-feira às 08:00 (São Paulo)"
 echo "   URL: ${SERVICE_URL}/lista-flexge-semanal/"
 echo "   WhatsApp: ${WHATSAPP_NUMBER}"
+echo "   Warmup: $WARMUP_JOB_NAME → ${SERVICE_URL}/warmup (a cada 10 min, 07h–21h)"
 echo ""
 echo "🧪 Para testar manualmente:"
 echo "   gcloud scheduler jobs run $JOB_NAME --location=$SCHEDULER_LOCATION --project=$PROJECT_ID"
@@ -0,0 +1,214 @@
+# ~/Downloads/OnboardingKarol/tracing.py
+# Tracing leve em processo: um trace por execução (webhook, cálculo) com spans
+# filhos por etapa. Exporta em JSONL rotativo e guarda os últimos N em memória.
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastjson import dumps
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() not in ("0", "false", "no")
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/traces.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "200"))
+# Acima disso os spans do trace não são guardados um a um: viram totais por nome
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "attrs", "start_wall", "start", "spans", "descartados", "error")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.descartados: Dict[str, Dict[str, Any]] = {}
+        self.error: Optional[str] = None
+
+    def to_dict(self, duration_ms: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": self.start_wall,
+            "duration_ms": round(duration_ms, 2),
+            "attrs": self.attrs,
+            "error": self.error,
+            "spans": self.spans,
+            "spans_descartados": {
+                nome: {**total, "duration_ms": round(total["duration_ms"], 2)}
+                for nome, total in self.descartados.items()
+            },
+        }
+
+
+_TRACE: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_SPAN_ID: ContextVar[Optional[int]] = ContextVar("span_id", default=None)
+
+_RECENTES: deque = deque(maxlen=TRACE_BUFFER)
+
+
+# ───────────────────────────── EXPORTADOR ───────────────────────────
+# A escrita em disco roda numa thread (QueueListener); o request só enfileira.
+_exporter = logging.getLogger("onboarding.traces")
+_exporter.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _iniciar_exportador() -> None:
+    global _listener
+    if _listener or not TRACE_ENABLED or not TRACE_FILE:
+        return
+    try:
+        arquivo = logging.handlers.RotatingFileHandler(
+            TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding="utf-8"
+        )
+    except OSError as e:
+        from logs import get_logger  # lazy: logs importa tracing
+        get_logger("tracing").warning("⚠️ Tracing: não foi possível abrir %s: %s", TRACE_FILE, e)
+        return
+    arquivo.setFormatter(logging.Formatter("%(message)s"))
+    fila: queue.SimpleQueue = queue.SimpleQueue()
+    _exporter.addHandler(logging.handlers.QueueHandler(fila))
+    _exporter.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(fila, arquivo)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def _exportar(registro: Dict[str, Any]) -> None:
+    _RECENTES.append(registro)
+    if _listener:
+        _exporter.info(dumps(registro).decode("utf-8"))
+
+
+def _descrever_erro(e: BaseException) -> str:
+    """Tipo da exceção (+ status HTTP). A mensagem fica de fora: pode trazer e-mail/URL com query."""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return f"{type(e).__name__} (HTTP {status})" if status else type(e).__name__
+
+
+# ─────────────────────────────── API ────────────────────────────────
+def current_trace_id() -> Optional[str]:
+    t = _TRACE.get()
+    return t.trace_id if t else None
+
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[Optional[Trace]]:
+    """Abre um trace raiz; spans abertos dentro dele (mesmo em outras tasks) viram filhos."""
+    if not TRACE_ENABLED:
+        yield None
+        return
+    _iniciar_exportador()
+    t = Trace(name, attrs)
+    tok_trace = _TRACE.set(t)
+    tok_span = _SPAN_ID.set(None)
+    try:
+        yield t
+    except BaseException as e:
+        t.error = _descrever_erro(e)
+        raise
+    finally:
+        _SPAN_ID.reset(tok_span)
+        _TRACE.reset(tok_trace)
+        _exportar(t.to_dict((time.perf_counter() - t.start) * 1000))
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    """Span filho do trace corrente; sem trace ativo é um no-op."""
+    t = _TRACE.get()
+    if t is None:
+        yield None
+        return
+    if len(t.spans) >= TRACE_MAX_SPANS:
+        with _agregado(t, name):
+            yield None
+        return
+    registro: Dict[str, Any] = {
+        "id": len(t.spans) + 1,
+        "parent": _SPAN_ID.get(),
+        "name": name,
+        "offset_ms": round((time.perf_counter() - t.start) * 1000, 2),
+        "duration_ms": None,
+        "attrs": attrs,
+    }
+    t.spans.append(registro)
+    tok = _SPAN_ID.set(registro["id"])
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    except BaseException as e:
+        registro["error"] = _descrever_erro(e)
+        raise
+    finally:
+        registro["duration_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+        _SPAN_ID.reset(tok)
+
+
+@contextmanager
+def _agregado(t: Trace, name: str) -> Iterator[None]:
+    """Span além de TRACE_MAX_SPANS: só soma contagem, duração e erros por nome."""
+    total = t.descartados.setdefault(name, {"count": 0, "duration_ms": 0.0, "errors": 0})
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        total["errors"] += 1
+        raise
+    finally:
+        total["count"] += 1
+        total["duration_ms"] += (time.perf_counter() - inicio) * 1000
+
+
+def recent_traces(limit: int = 20, name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Últimos traces finalizados, do mais novo para o mais antigo."""
+    saida = []
+    for registro in reversed(_RECENTES):
+        if name and registro["name"] != name:
+            continue
+        saida.append(registro)
+        if len(saida) >= limit:
+            break
+    return saida
+
+
+def render_waterfall(registro: Dict[str, Any], largura: int = 50) -> str:
+    """Desenha o trace como cascata em texto (uma linha por span)."""
+    total = registro["duration_ms"] or 1.0
+    linhas = [f"{registro['name']} {registro['trace_id']} — {total:.1f}ms"]
+    profundidade: Dict[int, int] = {}
+    for s in registro["spans"]:
+        nivel = profundidade.get(s["parent"], 0) + 1 if s["parent"] else 1
+        profundidade[s["id"]] = nivel
+        dur = s["duration_ms"] or 0.0
+        ini = int(s["offset_ms"] / total * largura)
+        tam = max(1, int(dur / total * largura))
+        barra = " " * ini + "█" * min(tam, largura - ini)
+        nome = ("  " * (nivel - 1) + s["name"])[:32]
+        erro = " ✗" if s.get("error") else ""
+        linhas.append(f"{nome:<32} |{barra:<{largura}}| {dur:8.1f}ms{erro}")
+    for nome, total in (registro.get("spans_descartados") or {}).items():
+        erros = f", {total['errors']} com erro" if total["errors"] else ""
+        linhas.append(f"+ {total['count']}× {nome} além do limite ({total['duration_ms']:.1f}ms no total{erros})")
+    return "\n".join(linhas)
+
+
+def shutdown() -> None:
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None